@@ -0,0 +1,55 @@
+from bisect import bisect_left
+from threading import Lock
+
+from api.cache import INGREDIENTS_CACHE_KEY, get_catalog_version
+from food.models import Ingredient
+
+
+class IngredientIndex:
+    def __init__(self):
+        self.lock = Lock()
+        self.catalog = None
+        self.version = None
+
+    def get_catalog(self):
+        version = get_catalog_version(INGREDIENTS_CACHE_KEY)
+        catalog = self.catalog
+        if catalog is not None and self.version == version:
+            return catalog
+        with self.lock:
+            if self.catalog is None or self.version != version:
+                entries = sorted(
+                    (name.lower(), id, name, measurement_unit)
+                    for id, name, measurement_unit
+                    in Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit'
+                    ).iterator()
+                )
+                self.catalog = (
+                    [entry[0] for entry in entries], entries
+                )
+                self.version = version
+            return self.catalog
+
+    def search(self, name, limit):
+        keys, entries = self.get_catalog()
+        name = name.lower()
+        position = bisect_left(keys, name)
+        found = list()
+        while (position < len(keys) and len(found) < limit
+               and keys[position].startswith(name)):
+            found.append(entries[position])
+            position += 1
+        if len(found) < limit:
+            for entry in entries:
+                if name in entry[0] and not entry[0].startswith(name):
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        return [
+            {'id': id, 'name': name, 'measurement_unit': measurement_unit}
+            for _, id, name, measurement_unit in found
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,16 @@
+def get_view_class(func):
+    return getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+
+
+def get_query_budget(resolver_match, method):
+    if resolver_match is None:
+        return None
+    func = resolver_match.func
+    budget = getattr(get_view_class(func), 'query_budget', None)
+    if budget is None:
+        return None
+    method = method.lower()
+    actions = getattr(func, 'actions', None)
+    if actions:
+        method = actions.get(method, method)
+    return budget.get(method)
@@ -0,0 +1,68 @@
+import hashlib
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.settings import CATALOG_CACHE_TIMEOUT
+
+TAGS_CACHE_KEY = 'catalog:tags'
+INGREDIENTS_CACHE_KEY = 'catalog:ingredients'
+TAG_SLUGS_CACHE_KEY = 'catalog:tag_slugs'
+PANTRY_CACHE_KEY = 'catalog:pantry'
+CONTENT_TYPE_CATALOG = 'application/json'
+
+
+def get_cached(key, build):
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def get_catalog(key, build):
+    catalog = cache.get(key)
+    if catalog is None:
+        content = JSONRenderer().render(build())
+        catalog = {
+            'content': content,
+            'etag': quote_etag(hashlib.md5(content).hexdigest()),
+            'last_modified': int(time.time()),
+        }
+        cache.set(key, catalog, CATALOG_CACHE_TIMEOUT)
+    return catalog
+
+
+def get_catalog_response(request, key, build):
+    catalog = get_catalog(key, build)
+    response = get_conditional_response(
+        request,
+        etag=catalog['etag'],
+        last_modified=catalog['last_modified']
+    )
+    if response is None:
+        response = HttpResponse(
+            catalog['content'], content_type=CONTENT_TYPE_CATALOG
+        )
+    response.headers['ETag'] = catalog['etag']
+    response.headers['Last-Modified'] = http_date(catalog['last_modified'])
+    return response
+
+
+def get_catalog_version(key):
+    version_key = f'{key}:version'
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, None)
+        version = cache.get(version_key)
+    return version
+
+
+def invalidate_catalog(key):
+    cache.delete(key)
+    cache.set(f'{key}:version', uuid4().hex, None)
@@ -1,17 +1,159 @@
-from django.db.models import Sum
+import csv
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from io import BytesIO
 
+from django.db.models import F, Sum, Window
+from django.db.models.functions import RowNumber
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import simpleSplit
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
 
-def get_shopping_cart_txt(recipes_ingredients):
-    file = ''
-    for ingredient_measurement_unit in recipes_ingredients.values(
-            'ingredient__name', 'ingredient__measurement_unit').distinct():
-        name = ingredient_measurement_unit.get('ingredient__name')
-        measurement_unit = ingredient_measurement_unit.get(
-            'ingredient__measurement_unit'
+from food.models import Recipe
+from foodgram.settings import (
+    SHOPPING_CART_PDF_FONT, SHOPPING_CART_PDF_FONT_SIZE
+)
+
+SHOPPING_CART_LINE = '*** {name} ({measurement_unit}) -- {total}\n'
+SHOPPING_CART_CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+SHOPPING_CART_PDF_TITLE = 'Список покупок'
+SHOPPING_CART_PDF_FONT_NAME = 'DejaVuSans'
+SHOPPING_CART_PDF_MARGIN = 20 * mm
+
+
+def get_shopping_cart_ingredients(recipes_ingredients):
+    return recipes_ingredients.values(
+        name=F('ingredient__name'),
+        measurement_unit=F('ingredient__measurement_unit'),
+    ).annotate(
+        total=Sum('amount')
+    ).order_by('name', 'measurement_unit')
+
+
+def prefetch_recent_recipes(authors, limit=None):
+    recipes = Recipe.objects.filter(author__in=authors).only(
+        'id', 'name', 'image', 'image_variants', 'cooking_time',
+        'author_id', 'pub_date'
+    )
+    if limit is not None:
+        recipes = recipes.annotate(row_number=Window(
+            RowNumber(),
+            partition_by=F('author_id'),
+            order_by=(F('pub_date').desc(), F('id').desc())
+        )).filter(row_number__lte=limit)
+    recent_recipes = defaultdict(list)
+    for recipe in recipes:
+        recent_recipes[recipe.author_id].append(recipe)
+    for author in authors:
+        author.recent_recipes = recent_recipes[author.id]
+    return authors
+
+
+class ShoppingCartExporter(ABC):
+    content_type = None
+    extension = None
+
+    def __init__(self, ingredients):
+        self.ingredients = ingredients
+
+    def __iter__(self):
+        yield from self.header()
+        for ingredient in self.ingredients.iterator():
+            yield self.render(ingredient)
+
+    def header(self):
+        return ()
+
+    @abstractmethod
+    def render(self, ingredient):
+        pass
+
+
+class TxtShoppingCartExporter(ShoppingCartExporter):
+    content_type = 'text/plain; charset=UTF-8'
+    extension = 'txt'
+
+    def render(self, ingredient):
+        return SHOPPING_CART_LINE.format(**ingredient)
+
+
+class EchoBuffer:
+    def write(self, value):
+        return value
+
+
+class CsvShoppingCartExporter(ShoppingCartExporter):
+    content_type = 'text/csv; charset=UTF-8'
+    extension = 'csv'
+
+    def __init__(self, ingredients):
+        super().__init__(ingredients)
+        self.writer = csv.writer(EchoBuffer())
+
+    def header(self):
+        yield self.writer.writerow(SHOPPING_CART_CSV_HEADER)
+
+    def render(self, ingredient):
+        return self.writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['total'],
+        ))
+
+
+def get_pdf_font():
+    if SHOPPING_CART_PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(
+            SHOPPING_CART_PDF_FONT_NAME, SHOPPING_CART_PDF_FONT
+        ))
+    return SHOPPING_CART_PDF_FONT_NAME
+
+
+class PdfShoppingCartExporter(TxtShoppingCartExporter):
+    content_type = 'application/pdf'
+    extension = 'pdf'
+
+    def __iter__(self):
+        # reportlab пишет подмножество шрифта и таблицу ссылок только в
+        # save(), поэтому PDF собирается в памяти и отдаётся одним куском.
+        font = get_pdf_font()
+        buffer = BytesIO()
+        canvas = Canvas(buffer, pagesize=A4)
+        canvas.setTitle(SHOPPING_CART_PDF_TITLE)
+        width, height = A4
+        text = self.begin_page(canvas, font, height)
+        text.textLine(SHOPPING_CART_PDF_TITLE)
+        text.moveCursor(0, SHOPPING_CART_PDF_FONT_SIZE)
+        for ingredient in self.ingredients.iterator():
+            for line in simpleSplit(
+                self.render(ingredient).rstrip('\n'), font,
+                SHOPPING_CART_PDF_FONT_SIZE,
+                width - 2 * SHOPPING_CART_PDF_MARGIN
+            ):
+                if text.getY() < SHOPPING_CART_PDF_MARGIN:
+                    canvas.drawText(text)
+                    canvas.showPage()
+                    text = self.begin_page(canvas, font, height)
+                text.textLine(line)
+        canvas.drawText(text)
+        canvas.save()
+        yield buffer.getvalue()
+
+    def begin_page(self, canvas, font, height):
+        text = canvas.beginText(
+            SHOPPING_CART_PDF_MARGIN, height - SHOPPING_CART_PDF_MARGIN
         )
-        amount_sum = recipes_ingredients.filter(
-            ingredient__name=name).aggregate(
-                Sum('ingredient__amount')).get('ingredient__amount__sum')
-        line = f'*** {name} ({measurement_unit}) -- {amount_sum}\n'
-        file += line
-    return file
+        text.setFont(font, SHOPPING_CART_PDF_FONT_SIZE)
+        return text
+
+
+SHOPPING_CART_EXPORTERS = {
+    exporter.extension: exporter
+    for exporter in (
+        TxtShoppingCartExporter, CsvShoppingCartExporter,
+        PdfShoppingCartExporter
+    )
+}
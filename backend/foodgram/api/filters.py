@@ -1,28 +1,67 @@
-from django_filters.rest_framework import CharFilter, FilterSet, BooleanFilter
+from django.db.models import Exists, F, OuterRef
+from django_filters.rest_framework import (
+    BooleanFilter, CharFilter, ChoiceFilter, FilterSet
+)
 
-from food.models import Recipe
+from api.cache import TAG_SLUGS_CACHE_KEY, get_cached
+from food.models import Recipe, RecipeTag, Tag
+from food.ranking import RANKING_ORDERINGS
+from food.search import search_recipes
+
+ORDERING_CHOICES = (
+    ('trending', 'В тренде'),
+    ('popular', 'Популярные'),
+)
+RANKED_FILTERS = ('search', 'ordering')
 
 
 class RecipeFilterSet(FilterSet):
     tags = CharFilter(method='filter_tags')
     is_favorited = BooleanFilter(method='filter_is_favorited')
     is_in_shopping_cart = BooleanFilter(method='filter_is_in_shopping_cart')
+    search = CharFilter(method='filter_search')
+    ordering = ChoiceFilter(
+        choices=ORDERING_CHOICES, method='filter_ordering'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart')
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering')
 
     def filter_tags(self, qs, name, value):
-        params = dict(self.request.query_params)
-        tags = params.get('tags')
-        return qs.filter(tag__slug__in=tags).distinct()
+        tag_slugs = get_cached(
+            TAG_SLUGS_CACHE_KEY,
+            lambda: dict(Tag.objects.values_list('slug', 'id'))
+        )
+        tag_ids = [
+            tag_slugs[slug]
+            for slug in self.request.query_params.getlist('tags')
+            if slug in tag_slugs
+        ]
+        if not tag_ids:
+            return qs.none()
+        return qs.filter(Exists(RecipeTag.objects.filter(
+            recipe=OuterRef('pk'), tag_id__in=tag_ids
+        )))
 
     def filter_is_favorited(self, qs, name, value):
-        if self.request.user.id is not None:
-            return qs.filter(favorites__user=self.request.user)
+        if value and self.request.user.is_authenticated:
+            return qs.filter(is_favorited=True)
         return qs
 
     def filter_is_in_shopping_cart(self, qs, name, value):
-        if self.request.user.id is not None:
-            return qs.filter(shopping_carts__user=self.request.user)
+        if value and self.request.user.is_authenticated:
+            return qs.filter(is_in_shopping_cart=True)
         return qs
+
+    def filter_search(self, qs, name, value):
+        return search_recipes(qs, value).order_by(
+            '-search_rank', '-pub_date', '-id'
+        )
+
+    def filter_ordering(self, qs, name, value):
+        return qs.order_by(
+            F(RANKING_ORDERINGS[value]).desc(nulls_last=True),
+            '-pub_date', '-id'
+        )
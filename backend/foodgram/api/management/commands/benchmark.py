@@ -0,0 +1,344 @@
+import json
+import math
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from api.budgets import get_query_budget
+from food.models import Ingredient, Recipe, Tag
+from users.models import User
+
+IMAGE = ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABie'
+         'ywaAAAACVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAAC'
+         'klEQVQImWNoAAAAggCByxOyYQAAAABJRU5ErkJggg==')
+
+Step = namedtuple('Step', ('name', 'method', 'path', 'data'), defaults=(None,))
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = max(math.ceil(len(values) * percent / 100) - 1, 0)
+    return values[index]
+
+
+def get_revision():
+    try:
+        return subprocess.run(
+            ('git', 'rev-parse', '--short', 'HEAD'),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа, число запросов к БД и выделение памяти '
+            'для основных эндпоинтов API')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--allocation-samples', type=int, default=5)
+        parser.add_argument('--user', help='Имя пользователя для запросов')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            help='Запускать только указанные сценарии'
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument(
+            '--compare', help='JSON с результатами для сравнения'
+        )
+        parser.add_argument(
+            '--check-budgets', action='store_true',
+            help='Завершиться с ошибкой, если превышен бюджет запросов'
+        )
+
+    def handle(self, *args, **options):
+        self.user = self.get_user(options['user'])
+        self.client = Client(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=self.user)[0].key
+        ))
+        scenarios = self.get_scenarios()
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - set(scenarios)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+                )
+            scenarios = {
+                name: scenarios[name] for name in options['scenarios']
+            }
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            ALLOWED_HOSTS=['testserver'], MEDIA_ROOT=media_root
+        ):
+            results = {}
+            for name, steps in scenarios.items():
+                results.update(self.run_scenario(
+                    steps, options['requests'], options['warmup'],
+                    options['allocation_samples']
+                ))
+        report = {
+            'meta': {
+                'revision': get_revision(),
+                'created': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+                'requests': options['requests'],
+            },
+            'results': results,
+        }
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)['results']
+        self.print_report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['check_budgets']:
+            self.check_budgets(results)
+
+    def check_budgets(self, results):
+        unbudgeted = [
+            name for name, result in results.items()
+            if result['budget'] is None
+        ]
+        if unbudgeted:
+            self.stderr.write(
+                f'Бюджет запросов не задан: {", ".join(unbudgeted)}'
+            )
+        exceeded = [
+            f'{name}: {result["queries"]} > {result["budget"]}'
+            for name, result in results.items()
+            if result['budget'] is not None
+            and result['queries'] > result['budget']
+        ]
+        if exceeded:
+            raise CommandError(
+                'Превышен бюджет запросов: ' + '; '.join(exceeded)
+            )
+
+    def get_user(self, username):
+        users = User.objects.all()
+        if username:
+            users = users.filter(username=username)
+        user = users.order_by('-recipes_count', 'id').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей; сначала запустите seed_data.'
+            )
+        return user
+
+    def get_scenarios(self):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        if recipe is None:
+            raise CommandError('Нет рецептов; сначала запустите seed_data.')
+        toggled = Recipe.objects.exclude(
+            favorites__user=self.user
+        ).exclude(shopping_carts__user=self.user).order_by('id').first()
+        if toggled is None:
+            raise CommandError(
+                'Все рецепты уже в избранном и списке покупок пользователя.'
+            )
+        author = User.objects.exclude(id=self.user.id).exclude(
+            subscribers__subscriber=self.user
+        ).order_by('id').first()
+        tags = list(Tag.objects.order_by('id')[:2])
+        ingredients = list(Ingredient.objects.order_by('id')[:3])
+        tag_query = '&'.join(f'tags={tag.slug}' for tag in tags)
+        pantry_query = '&'.join(
+            f'ingredients={ingredient.id}' for ingredient in ingredients
+        )
+        prefix = ingredients[0].name[:2] if ingredients else ''
+        search = recipe.name.split()[0] if recipe.name.split() else ''
+        favorite = f'/api/recipes/{toggled.id}/favorite/'
+        shopping_cart = f'/api/recipes/{toggled.id}/shopping_cart/'
+        recipe_data = {
+            'tags': [tag.id for tag in tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': number + 1}
+                for number, ingredient in enumerate(ingredients)
+            ],
+            'image': IMAGE,
+            'name': 'Замер',
+            'text': 'Рецепт для замера',
+            'cooking_time': 10,
+        }
+        scenarios = {
+            'recipe_list': (Step('recipe_list', 'get', '/api/recipes/'),),
+            'recipe_list_tags': (
+                Step('recipe_list_tags', 'get', f'/api/recipes/?{tag_query}'),
+            ),
+            'recipe_list_cursor': (
+                Step('recipe_list_cursor', 'get',
+                     '/api/recipes/?pagination=cursor'),
+            ),
+            'recipe_search': (
+                Step('recipe_search', 'get',
+                     f'/api/recipes/?search={search}'),
+            ),
+            'recipe_detail': (
+                Step('recipe_detail', 'get', f'/api/recipes/{recipe.id}/'),
+            ),
+            'recipe_write': (
+                Step('recipe_create', 'post', '/api/recipes/', recipe_data),
+                Step('recipe_update', 'patch', '/api/recipes/{id}/',
+                     {**recipe_data, 'image': None,
+                      'ingredients': recipe_data['ingredients'][:2]}),
+                Step('recipe_delete', 'delete', '/api/recipes/{id}/'),
+            ),
+            'tags': (
+                Step('tag_list', 'get', '/api/tags/'),
+                Step('tag_detail', 'get', f'/api/tags/{tags[0].id}/')
+                if tags else None,
+            ),
+            'ingredients': (
+                Step('ingredient_list', 'get', '/api/ingredients/'),
+                Step('ingredient_detail', 'get',
+                     f'/api/ingredients/{ingredients[0].id}/')
+                if ingredients else None,
+            ),
+            'ingredient_search': (
+                Step('ingredient_search', 'get',
+                     f'/api/ingredients/?name={prefix}'),
+            ),
+            'users': (
+                Step('user_list', 'get', '/api/users/'),
+                Step('user_detail', 'get', f'/api/users/{self.user.id}/'),
+                Step('user_me', 'get', '/api/users/me/'),
+            ),
+            'subscriptions': (
+                Step('subscriptions', 'get',
+                     '/api/users/subscriptions/?recipes_limit=3'),
+            ),
+            'subscribe_toggle': (
+                Step('subscribe', 'post',
+                     f'/api/users/{author.id}/subscribe/?recipes_limit=3'),
+                Step('unsubscribe', 'delete',
+                     f'/api/users/{author.id}/subscribe/'),
+            ) if author else (),
+            'favorite_toggle': (
+                Step('favorite_add', 'post', favorite),
+                Step('favorite_remove', 'delete', favorite),
+            ),
+            'shopping_cart_toggle': (
+                Step('shopping_cart_add', 'post', shopping_cart),
+                Step('shopping_cart_remove', 'delete', shopping_cart),
+            ),
+            'pantry': (
+                Step('pantry', 'get', f'/api/recipes/pantry/?{pantry_query}'),
+            ),
+            'shopping_cart_download': (
+                Step('shopping_cart_download', 'get',
+                     '/api/recipes/download_shopping_cart/'),
+            ),
+        }
+        return {
+            name: tuple(step for step in steps if step is not None)
+            for name, steps in scenarios.items()
+        }
+
+    def request(self, step, state):
+        path = step.path.format(**state)
+        if step.data is None:
+            response = getattr(self.client, step.method)(path)
+        else:
+            response = getattr(self.client, step.method)(
+                path, step.data, content_type='application/json'
+            )
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elif step.method == 'post' and response.status_code == 201:
+            state['id'] = response.json().get('id')
+        return response
+
+    def run_scenario(self, steps, count, warmup, allocation_samples):
+        samples = {
+            step.name: {'timings': [], 'queries': [], 'allocations': [],
+                        'statuses': set(), 'budget': None}
+            for step in steps
+        }
+        for _ in range(warmup):
+            state = {}
+            for step in steps:
+                self.request(step, state)
+        for _ in range(count):
+            state = {}
+            for step in steps:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    response = self.request(step, state)
+                    elapsed = time.perf_counter() - started
+                sample = samples[step.name]
+                sample['timings'].append(elapsed * 1000)
+                sample['queries'].append(len(queries))
+                sample['statuses'].add(response.status_code)
+                sample['budget'] = get_query_budget(
+                    response.resolver_match, step.method
+                )
+        tracemalloc.start()
+        try:
+            for _ in range(allocation_samples):
+                state = {}
+                for step in steps:
+                    tracemalloc.reset_peak()
+                    before = tracemalloc.get_traced_memory()[0]
+                    self.request(step, state)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    samples[step.name]['allocations'].append(peak - before)
+        finally:
+            tracemalloc.stop()
+        return {
+            name: {
+                'p50_ms': round(percentile(sample['timings'], 50), 3),
+                'p95_ms': round(percentile(sample['timings'], 95), 3),
+                'mean_ms': round(statistics.mean(sample['timings']), 3),
+                'queries': max(sample['queries']),
+                'budget': sample['budget'],
+                'peak_alloc_kib': round(
+                    statistics.median(sample['allocations']) / 1024, 1
+                ) if sample['allocations'] else None,
+                'statuses': sorted(sample['statuses']),
+            }
+            for name, sample in samples.items()
+            if sample['timings']
+        }
+
+    def print_report(self, results, baseline=None):
+        self.stdout.write(
+            f'{"сценарий":<24}{"p50, мс":>10}{"p95, мс":>10}'
+            f'{"запросы":>9}{"память, КиБ":>13}  статусы'
+        )
+        for name, result in results.items():
+            queries = str(result['queries'])
+            if result['budget'] is not None:
+                queries += f'/{result["budget"]}'
+            line = (
+                f'{name:<24}{result["p50_ms"]:>10.2f}'
+                f'{result["p95_ms"]:>10.2f}{queries:>9}'
+                f'{result["peak_alloc_kib"] or 0:>13.1f}  '
+                f'{",".join(map(str, result["statuses"]))}'
+            )
+            previous = (baseline or {}).get(name)
+            if previous:
+                change = (
+                    (result['p50_ms'] - previous['p50_ms'])
+                    / previous['p50_ms'] * 100
+                    if previous['p50_ms'] else 0
+                )
+                line += (
+                    f'  p50 {change:+.0f}%, '
+                    f'запросы {result["queries"] - previous["queries"]:+d}'
+                )
+            self.stdout.write(line)
@@ -0,0 +1,196 @@
+import random
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.cache import (
+    INGREDIENTS_CACHE_KEY, PANTRY_CACHE_KEY, TAG_SLUGS_CACHE_KEY,
+    TAGS_CACHE_KEY, invalidate_catalog
+)
+from food.counters import rebuild_counters
+from food.importers import load_ingredients, read_csv
+from food.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+    ShoppingCart, Tag
+)
+from food.search import index_recipes
+from foodgram.settings import (
+    BASE_DIR, MAX_COOKING_TIME, MAX_INGREDIENTS_AMOUNT, MIN_COOKING_TIME,
+    MIN_INGREDIENTS_AMOUNT
+)
+from users.models import Subscription, User
+
+INGREDIENTS_CSV = BASE_DIR.parent.parent / 'data' / 'ingredients.csv'
+SEED_IMAGE = 'recipe/images/seed.png'
+SEED_PASSWORD = 'seed-password'
+BATCH_SIZE = 1000
+
+
+def batched(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, списками покупок и подписками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=5000)
+        parser.add_argument('--carts', type=int, default=2000)
+        parser.add_argument('--subscriptions', type=int, default=500)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8
+        )
+        parser.add_argument('--prefix', default='seed')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--ingredients-csv', default=INGREDIENTS_CSV)
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.ensure_ingredients(options['ingredients_csv'])
+        tag_ids = self.create_tags(options['tags'], options['prefix'])
+        user_ids = self.create_users(options['users'], options['prefix'])
+        if not user_ids:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        recipe_ids = self.create_recipes(
+            options['recipes'], user_ids, tag_ids,
+            options['ingredients_per_recipe']
+        )
+        if recipe_ids:
+            self.create_pairs(
+                Favorite, 'user_id', 'recipe_id',
+                user_ids, recipe_ids, options['favorites']
+            )
+            self.create_pairs(
+                ShoppingCart, 'user_id', 'recipe_id',
+                user_ids, recipe_ids, options['carts']
+            )
+        self.create_pairs(
+            Subscription, 'subscriber_id', 'user_id',
+            user_ids, user_ids, options['subscriptions'],
+            allow_same=False
+        )
+        rebuild_counters(Recipe, Favorite, ShoppingCart, User)
+        index_recipes(recipe_ids)
+        transaction.on_commit(self.invalidate_caches)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, '
+            f'рецептов: {len(recipe_ids)}'
+        ))
+
+    def invalidate_caches(self):
+        invalidate_catalog(INGREDIENTS_CACHE_KEY)
+        invalidate_catalog(TAGS_CACHE_KEY)
+        invalidate_catalog(PANTRY_CACHE_KEY)
+        cache.delete(TAG_SLUGS_CACHE_KEY)
+
+    def ensure_ingredients(self, path):
+        if Ingredient.objects.exists():
+            return
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                load_ingredients(read_csv(file))
+        except OSError as error:
+            raise CommandError(
+                f'Не удалось прочитать ингредиенты: {error}'
+            )
+
+    def create_tags(self, count, prefix):
+        Tag.objects.bulk_create(
+            (
+                Tag(
+                    name=f'{prefix} {number}',
+                    slug=f'{prefix}-{number}',
+                    color=f'#{self.random.randrange(0x1000000):06X}'
+                )
+                for number in range(count)
+            ),
+            ignore_conflicts=True
+        )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count, prefix):
+        offset = User.objects.filter(username__startswith=prefix).count()
+        password = make_password(SEED_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'{prefix}{number}',
+                    email=f'{prefix}{number}@example.com',
+                    first_name='Имя',
+                    last_name='Фамилия',
+                    password=password
+                )
+                for number in range(offset, offset + count)
+            ),
+            batch_size=BATCH_SIZE
+        )
+        return list(User.objects.filter(
+            username__startswith=prefix
+        ).values_list('id', flat=True))
+
+    def create_recipes(self, count, user_ids, tag_ids, ingredients_count):
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        ingredients_count = min(ingredients_count, len(ingredient_ids))
+        recipe_ids = []
+        for batch in batched(range(count)):
+            recipes = Recipe.objects.bulk_create(
+                Recipe(
+                    author_id=self.random.choice(user_ids),
+                    name=f'Рецепт {number}',
+                    text='Описание рецепта. ' * 20,
+                    cooking_time=self.random.randint(
+                        MIN_COOKING_TIME, min(MAX_COOKING_TIME, 240)
+                    ),
+                    image=SEED_IMAGE
+                )
+                for number in batch
+            )
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag_id=tag_id)
+                for recipe in recipes
+                for tag_id in self.random.sample(
+                    tag_ids, min(len(tag_ids), self.random.randint(1, 3))
+                )
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(
+                        MIN_INGREDIENTS_AMOUNT,
+                        min(MAX_INGREDIENTS_AMOUNT, 1000)
+                    )
+                )
+                for recipe in recipes
+                for ingredient_id in self.random.sample(
+                    ingredient_ids, ingredients_count
+                )
+            )
+            recipe_ids.extend(recipe.id for recipe in recipes)
+        return recipe_ids
+
+    def create_pairs(self, model, left, right, left_ids, right_ids, count,
+                     allow_same=True):
+        pairs = {
+            (self.random.choice(left_ids), self.random.choice(right_ids))
+            for _ in range(count)
+        }
+        if not allow_same:
+            pairs = {(a, b) for a, b in pairs if a != b}
+        model.objects.bulk_create(
+            (model(**{left: a, right: b}) for a, b in pairs),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True
+        )
@@ -0,0 +1,202 @@
+import bisect
+import json
+import logging
+import threading
+import time
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from api.budgets import get_query_budget
+
+from foodgram.settings import (
+    REQUEST_METRICS, REQUEST_METRICS_LATENCY_BUCKETS,
+    REQUEST_METRICS_QUERY_BUCKETS
+)
+
+logger = logging.getLogger('foodgram.metrics')
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+    def as_dict(self):
+        return {
+            'buckets': {
+                **{
+                    str(bound): count
+                    for bound, count in zip(self.buckets, self.counts)
+                },
+                '+Inf': self.counts[-1],
+            },
+            'sum': round(self.total, 3),
+        }
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.requests = 0
+        self.latency = Histogram(REQUEST_METRICS_LATENCY_BUCKETS)
+        self.db_time = Histogram(REQUEST_METRICS_LATENCY_BUCKETS)
+        self.app_time = Histogram(REQUEST_METRICS_LATENCY_BUCKETS)
+        self.render_time = Histogram(REQUEST_METRICS_LATENCY_BUCKETS)
+        self.queries = Histogram(REQUEST_METRICS_QUERY_BUCKETS)
+        self.response_bytes = 0
+
+    def observe(self, metrics):
+        self.requests += 1
+        self.latency.observe(metrics['total_ms'])
+        self.db_time.observe(metrics['db_ms'])
+        self.app_time.observe(metrics['app_ms'])
+        self.render_time.observe(metrics['render_ms'])
+        self.queries.observe(metrics['queries'])
+        self.response_bytes += metrics['size'] or 0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'latency_ms': self.latency.as_dict(),
+            'db_ms': self.db_time.as_dict(),
+            'app_ms': self.app_time.as_dict(),
+            'render_ms': self.render_time.as_dict(),
+            'queries': self.queries.as_dict(),
+            'response_bytes': self.response_bytes,
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, metrics):
+        with self.lock:
+            if view not in self.views:
+                self.views[view] = ViewMetrics()
+            self.views[view].observe(metrics)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                view: metrics.as_dict()
+                for view, metrics in sorted(self.views.items())
+            }
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+metrics_registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        if not REQUEST_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        request.render_duration = 0
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        if response.streaming:
+            # Запросы потокового ответа (список покупок) выполняются, пока
+            # отдаётся тело: метрики записываются, когда оно дочитано, а в
+            # Server-Timing попадает только время до первого байта.
+            metrics = self.get_metrics(request, response, timer, started)
+            response.streaming_content = self.stream(
+                request, response, timer, started,
+                response.streaming_content
+            )
+        else:
+            metrics = self.get_metrics(
+                request, response, timer, started, len(response.content)
+            )
+            self.observe(request, metrics)
+        response.headers['Server-Timing'] = (
+            f'db;dur={metrics["db_ms"]};desc="{metrics["queries"]} queries", '
+            f'app;dur={metrics["app_ms"]};desc="view and serializers", '
+            f'render;dur={metrics["render_ms"]}, '
+            f'total;dur={metrics["total_ms"]}'
+        )
+        return response
+
+    def stream(self, request, response, timer, started, content):
+        size = 0
+        try:
+            with connection.execute_wrapper(timer):
+                for chunk in content:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self.observe(
+                request,
+                self.get_metrics(request, response, timer, started, size)
+            )
+
+    def get_metrics(self, request, response, timer, started, size=None):
+        total = time.perf_counter() - started
+        # Сериализаторы DRF строят данные внутри view вперемешку с
+        # запросами, поэтому app — это всё время без БД и рендеринга:
+        # код view вместе с сериализаторами, а не чистое время сериализации.
+        app = max(total - timer.duration - request.render_duration, 0)
+        return {
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timer.count,
+            'db_ms': round(timer.duration * 1000, 3),
+            'app_ms': round(app * 1000, 3),
+            'render_ms': round(request.render_duration * 1000, 3),
+            'total_ms': round(total * 1000, 3),
+            'size': size,
+            'budget': get_query_budget(
+                request.resolver_match, request.method
+            ),
+        }
+
+    def observe(self, request, metrics):
+        view = 'unresolved'
+        if request.resolver_match is not None:
+            view = request.resolver_match.view_name
+        if (metrics['budget'] is not None
+                and metrics['queries'] > metrics['budget']):
+            logger.warning(json.dumps(
+                {'view': view, 'event': 'query_budget_exceeded', **metrics}
+            ))
+        metrics_registry.observe(view, metrics)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({'view': view, **metrics}))
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def finish_render(response):
+            request.render_duration = time.perf_counter() - started
+
+        response.add_post_render_callback(finish_render)
+        return response
@@ -0,0 +1,76 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.generics import get_object_or_404
+
+from api.cache import (
+    INGREDIENTS_CACHE_KEY, TAGS_CACHE_KEY, get_catalog_version
+)
+
+STAMP_FIELDS = (
+    'id', 'pub_date', 'updated_at',
+    'is_favorited', 'is_in_shopping_cart', 'is_author_subscribed',
+    'author__email', 'author__username', 'author__first_name',
+    'author__last_name',
+)
+
+
+class ConditionalRecipeMixin:
+    def get_stamps(self, queryset):
+        return queryset.select_related(None).prefetch_related(None).values(
+            *STAMP_FIELDS
+        )
+
+    def get_etag(self, stamps, envelope=None):
+        digest = hashlib.md5(';'.join((
+            str(self.request.user.id),
+            get_catalog_version(TAGS_CACHE_KEY),
+            get_catalog_version(INGREDIENTS_CACHE_KEY),
+        )).encode())
+        if envelope is not None:
+            digest.update(repr(sorted(envelope.items())).encode())
+        for stamp in stamps:
+            digest.update(repr(tuple(
+                stamp[field] for field in STAMP_FIELDS
+            )).encode())
+        return quote_etag(digest.hexdigest())
+
+    def get_not_modified_response(self, etag):
+        response = get_conditional_response(self.request, etag=etag)
+        if response is not None:
+            response.headers['ETag'] = etag
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stamps = self.paginate_queryset(self.get_stamps(queryset))
+        if stamps is None:
+            return super().list(request, *args, **kwargs)
+        envelope = dict(self.get_paginated_response([]).data)
+        envelope.pop('results', None)
+        etag = self.get_etag(stamps, envelope)
+        response = self.get_not_modified_response(etag)
+        if response is not None:
+            return response
+        recipes = queryset.in_bulk([stamp['id'] for stamp in stamps])
+        serializer = self.get_serializer([
+            recipes[stamp['id']] for stamp in stamps
+            if stamp['id'] in recipes
+        ], many=True)
+        response = self.get_paginated_response(serializer.data)
+        response.headers['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        stamp = get_object_or_404(
+            self.get_stamps(self.filter_queryset(self.get_queryset())),
+            pk=self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        )
+        etag = self.get_etag([stamp])
+        response = self.get_not_modified_response(etag)
+        if response is not None:
+            return response
+        response = super().retrieve(request, *args, **kwargs)
+        response.headers['ETag'] = etag
+        return response
@@ -1,5 +1,123 @@
-from rest_framework.pagination import PageNumberPagination
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    Cursor, CursorPagination, PageNumberPagination
+)
+from rest_framework.response import Response
+
+PAGINATION_QUERY_PARAM = 'pagination'
+CURSOR_PAGINATION = 'cursor'
+POSITION_SEPARATOR = '|'
+
+
+def use_cursor_pagination(request):
+    return (
+        request.query_params.get(PAGINATION_QUERY_PARAM) == CURSOR_PAGINATION
+        or CursorPagination.cursor_query_param in request.query_params
+    )
 
 
 class RecipePageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
+
+
+# Стандартный CursorPagination запоминает только первое поле сортировки и
+# смещение среди равных значений; при обратном обходе совпадающих pub_date
+# это даёт пропуски и повторы. Здесь позиция — значения всех полей
+# сортировки, а страница начинается строго после неё.
+class CountlessCursorPagination(CursorPagination):
+    page_size_query_param = 'limit'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ] if reverse else list(self.ordering)
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None and self.cursor.position is not None:
+            queryset = queryset.filter(self.get_position_filter(
+                queryset.model, ordering, self.cursor.position
+            ))
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+        return self.page
+
+    def get_position_filter(self, model, ordering, position):
+        values = position.split(POSITION_SEPARATOR)
+        if len(values) != len(ordering):
+            raise NotFound(self.invalid_cursor_message)
+        conditions = list()
+        equal = dict()
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            try:
+                value = model._meta.get_field(name).to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            conditions.append(Q(**equal, **{f'{name}__{lookup}': value}))
+            equal[name] = value
+        return reduce(or_, conditions)
+
+    def get_position(self, item):
+        values = list()
+        for field in self.ordering:
+            name = field.lstrip('-')
+            value = item[name] if isinstance(item, dict) else getattr(
+                item, name
+            )
+            values.append(
+                value.isoformat() if hasattr(value, 'isoformat')
+                else str(value)
+            )
+        return POSITION_SEPARATOR.join(values)
+
+    def get_link(self, item, reverse):
+        return self.encode_cursor(Cursor(
+            offset=0, reverse=reverse, position=self.get_position(item)
+        ))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.get_link(self.page[-1], False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.get_link(self.page[0], True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict((
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        )))
+
+
+class RecipeCursorPagination(CountlessCursorPagination):
+    ordering = ('-pub_date', '-id')
+
+
+class SubscriptionCursorPagination(CountlessCursorPagination):
+    ordering = ('id',)
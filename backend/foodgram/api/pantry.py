@@ -0,0 +1,243 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from threading import Lock
+
+from django.core.cache import cache
+
+from api.cache import (
+    PANTRY_CACHE_KEY, get_catalog_version, invalidate_catalog
+)
+from food.models import RecipeIngredient
+from foodgram.settings import CATALOG_CACHE_TIMEOUT, PANTRY_MAX_CHANGES
+
+POSTING_BITS = 32
+
+
+def to_bitset(recipe_ids):
+    bits = bytearray((max(recipe_ids, default=0) >> 3) + 1)
+    for recipe_id in recipe_ids:
+        bits[recipe_id >> 3] |= 1 << (recipe_id & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def count_bits(bitset):
+    return bin(bitset).count('1')
+
+
+def iter_bits(bitset):
+    while bitset:
+        position = bitset.bit_length() - 1
+        yield position
+        bitset ^= 1 << position
+
+
+def has_recipe(posting, recipe_id):
+    if isinstance(posting, int):
+        return posting >> recipe_id & 1
+    position = bisect_left(posting, recipe_id)
+    return position < len(posting) and posting[position] == recipe_id
+
+
+class PantryMatches:
+    def __init__(self, groups, total):
+        self.groups = groups
+        self.total = total
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, items):
+        start, stop, _ = items.indices(self.total)
+        limit = stop - start
+        matches = list()
+        for coverage, matched, bitset in self.groups:
+            if len(matches) >= limit:
+                break
+            size = count_bits(bitset)
+            if start >= size:
+                start -= size
+                continue
+            for position, recipe_id in enumerate(iter_bits(bitset)):
+                if position < start:
+                    continue
+                if len(matches) >= limit:
+                    break
+                matches.append((recipe_id, matched, coverage))
+            start = 0
+        return matches
+
+
+class PantryIndex:
+    def __init__(self):
+        self.lock = Lock()
+        self.postings = None
+        self.sizes = None
+        self.universe = 0
+        self.version = None
+        self.sequence = 0
+
+    def get_sequence_key(self, version):
+        return f'{PANTRY_CACHE_KEY}:{version}:sequence'
+
+    def get_change_key(self, version, sequence):
+        return f'{PANTRY_CACHE_KEY}:{version}:{sequence}'
+
+    def record_change(self, recipe_id):
+        version = get_catalog_version(PANTRY_CACHE_KEY)
+        sequence_key = self.get_sequence_key(version)
+        cache.add(sequence_key, 0, None)
+        try:
+            sequence = cache.incr(sequence_key)
+        except ValueError:
+            invalidate_catalog(PANTRY_CACHE_KEY)
+            return
+        # incr в файловом кеше и в кеше в БД не атомарен: два процесса
+        # могут получить один номер, и одна запись пропадёт. Занятый номер
+        # значит, что журналу верить нельзя, и индекс надо перестроить.
+        if not cache.add(
+            self.get_change_key(version, sequence), recipe_id,
+            CATALOG_CACHE_TIMEOUT
+        ):
+            invalidate_catalog(PANTRY_CACHE_KEY)
+
+    def sync(self):
+        version = get_catalog_version(PANTRY_CACHE_KEY)
+        sequence = cache.get(self.get_sequence_key(version), 0)
+        if sequence == self.sequence and self.version == version:
+            return
+        changes = None
+        if (self.postings is not None and self.version == version
+                and 0 < sequence - self.sequence <= PANTRY_MAX_CHANGES):
+            keys = [
+                self.get_change_key(version, number)
+                for number in range(self.sequence + 1, sequence + 1)
+            ]
+            changes = cache.get_many(keys)
+            # Пропуск в журнале (запись вытеснена из кеша или истекла)
+            # означает потерянное изменение.
+            if len(changes) < len(keys):
+                changes = None
+        if changes is None:
+            self.build(version, sequence)
+        else:
+            self.apply(list(changes.values()))
+            self.sequence = sequence
+
+    def build(self, version, sequence):
+        postings = defaultdict(lambda: array('I'))
+        recipes_by_size = defaultdict(list)
+        links = RecipeIngredient.objects.order_by(
+            'recipe_id', 'ingredient_id'
+        ).values_list('recipe_id', 'ingredient_id').iterator()
+        recipe_id = -1
+        for recipe_id, group in groupby(links, itemgetter(0)):
+            size = 0
+            for _, ingredient_id in group:
+                postings[ingredient_id].append(recipe_id)
+                size += 1
+            recipes_by_size[size].append(recipe_id)
+        self.universe = recipe_id + 1
+        self.postings = {
+            ingredient_id: (
+                to_bitset(posting)
+                if len(posting) * POSTING_BITS >= self.universe
+                else posting
+            )
+            for ingredient_id, posting in postings.items()
+        }
+        self.sizes = {
+            size: to_bitset(recipe_ids)
+            for size, recipe_ids in recipes_by_size.items()
+        }
+        self.version = version
+        self.sequence = sequence
+
+    def apply(self, recipe_ids):
+        links = defaultdict(list)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            links[recipe_id].append(ingredient_id)
+        for recipe_id in set(recipe_ids):
+            self.remove(recipe_id)
+            self.add(recipe_id, links[recipe_id])
+
+    def remove(self, recipe_id):
+        for ingredient_id, posting in self.postings.items():
+            if not has_recipe(posting, recipe_id):
+                continue
+            if isinstance(posting, int):
+                self.postings[ingredient_id] = posting ^ (1 << recipe_id)
+            else:
+                del posting[bisect_left(posting, recipe_id)]
+        for size, bitset in self.sizes.items():
+            if has_recipe(bitset, recipe_id):
+                self.sizes[size] = bitset ^ (1 << recipe_id)
+
+    def add(self, recipe_id, ingredient_ids):
+        if not ingredient_ids:
+            return
+        self.universe = max(self.universe, recipe_id + 1)
+        for ingredient_id in ingredient_ids:
+            posting = self.postings.get(ingredient_id, array('I'))
+            if isinstance(posting, int):
+                posting |= 1 << recipe_id
+            else:
+                insort(posting, recipe_id)
+                if len(posting) * POSTING_BITS >= self.universe:
+                    posting = to_bitset(posting)
+            self.postings[ingredient_id] = posting
+        size = len(ingredient_ids)
+        self.sizes[size] = self.sizes.get(size, 0) | 1 << recipe_id
+
+    def get_bitset(self, ingredient_id):
+        posting = self.postings.get(ingredient_id, 0)
+        if isinstance(posting, int):
+            return posting
+        return to_bitset(posting)
+
+    def match(self, ingredient_ids):
+        with self.lock:
+            self.sync()
+            bitsets = [
+                self.get_bitset(ingredient_id)
+                for ingredient_id in set(ingredient_ids)
+            ]
+            sizes = list(self.sizes.items())
+        union = 0
+        counters = list()
+        for bitset in bitsets:
+            union |= bitset
+            carry = bitset
+            for position, counter in enumerate(counters):
+                counters[position] = counter ^ carry
+                carry &= counter
+                if not carry:
+                    break
+            if carry:
+                counters.append(carry)
+        groups = list()
+        for matched in range(1, len(bitsets) + 1):
+            if matched.bit_length() > len(counters):
+                break
+            recipes = union
+            for position, counter in enumerate(counters):
+                if matched >> position & 1:
+                    recipes &= counter
+                else:
+                    recipes &= ~counter
+            if not recipes:
+                continue
+            for size, bitset in sizes:
+                if size >= matched and recipes & bitset:
+                    groups.append(
+                        (matched / size, matched, recipes & bitset)
+                    )
+        groups.sort(key=itemgetter(0, 1), reverse=True)
+        return PantryMatches(groups, count_bits(union))
+
+
+pantry_index = PantryIndex()
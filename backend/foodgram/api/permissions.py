@@ -1,5 +1,7 @@
 from rest_framework import permissions
 
+from users.models import ADMINISTRATOR
+
 
 class OwnerOrReadOnly(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
@@ -11,3 +13,10 @@ class OwnerOrReadOnly(permissions.BasePermission):
 class IsOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
         return obj.author == request.user
+
+
+class IsAdministrator(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and (
+            request.user.is_staff or request.user.role == ADMINISTRATOR
+        )
@@ -1,15 +1,27 @@
 import base64
+import binascii
+import json
+from tempfile import SpooledTemporaryFile
 
 from django.db import transaction
-from django.core.files.base import ContentFile
+from django.core.files.base import File
+from PIL import Image
 from django.forms.models import model_to_dict
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
 
 from foodgram.settings import (
     MAX_INGREDIENTS_AMOUNT, MIN_INGREDIENTS_AMOUNT,
-    MIN_COOKING_TIME, MAX_COOKING_TIME
+    MIN_COOKING_TIME, MAX_COOKING_TIME, PANTRY_MAX_INGREDIENTS,
+    RECIPE_IMAGE_FORMATS,
+    RECIPE_IMAGE_MAX_PIXELS, RECIPE_IMAGE_MAX_SIZE, RECIPE_IMAGE_SPOOL_SIZE
+)
+from food.images import (
+    IMAGE_EXTENSIONS, IMAGE_HEADER_SIZE, detect_image_format,
+    schedule_image_variants
 )
 from food.models import Favorite, Ingredient, Recipe
+from food.search import index_recipe
 from food.models import RecipeIngredient, RecipeTag, ShoppingCart, Tag
 from users.models import User
 from users.serializers import UserSerializer
@@ -27,15 +39,100 @@ NOT_UNIQUE_TAGS_ERROR = 'Тэги должны быть уникальными'
 COOKING_TIME_ERROR = ('Время приготовления должно быть больше'
                       f' {MIN_COOKING_TIME}'
                       f' и меньше {MAX_COOKING_TIME}')
+IMAGE_SIZE_ERROR = ('Размер изображения должен быть не больше'
+                    f' {RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)} МБ')
+IMAGE_FORMAT_ERROR = ('Поддерживаются изображения в форматах'
+                      f' {", ".join(RECIPE_IMAGE_FORMATS)}')
+IMAGE_PIXELS_ERROR = 'Слишком большое разрешение изображения'
+INVALID_JSON_ERROR = 'Ожидается JSON'
+BASE64_MARKER = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
 
 
 class Base64ImageField(serializers.ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='image.' + ext)
-        return super().to_internal_value(data)
+            data = self.decode(data)
+        if getattr(data, 'size', 0) > RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(IMAGE_SIZE_ERROR)
+        file = serializers.FileField.to_internal_value(self, data)
+        self.validate_image(file)
+        return file
+
+    def decode(self, data):
+        start = data.find(BASE64_MARKER)
+        if start == -1:
+            self.fail('invalid_image')
+        start += len(BASE64_MARKER)
+        if (len(data) - start) * 3 // 4 > RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(IMAGE_SIZE_ERROR)
+        file = SpooledTemporaryFile(max_size=RECIPE_IMAGE_SPOOL_SIZE)
+        carry = ''
+        try:
+            for position in range(start, len(data), BASE64_CHUNK_SIZE):
+                # MIME-кодировщики переносят строки, а b64decode с validate
+                # пробелы не пропускает; хвост до кратной 4 длины переносим
+                # в следующий кусок.
+                chunk = carry + ''.join(
+                    data[position:position + BASE64_CHUNK_SIZE].split()
+                )
+                aligned = len(chunk) - len(chunk) % 4
+                carry = chunk[aligned:]
+                file.write(base64.b64decode(chunk[:aligned], validate=True))
+            if carry:
+                raise binascii.Error
+        except binascii.Error:
+            file.close()
+            self.fail('invalid_image')
+        size = file.tell()
+        file.seek(0)
+        image_format = detect_image_format(file.read(IMAGE_HEADER_SIZE))
+        file.seek(0)
+        if image_format not in RECIPE_IMAGE_FORMATS:
+            file.close()
+            raise serializers.ValidationError(IMAGE_FORMAT_ERROR)
+        decoded = File(file, name=f'image.{IMAGE_EXTENSIONS[image_format]}')
+        decoded.size = size
+        return decoded
+
+    def validate_image(self, file):
+        file.seek(0)
+        if detect_image_format(
+                file.read(IMAGE_HEADER_SIZE)) not in RECIPE_IMAGE_FORMATS:
+            raise serializers.ValidationError(IMAGE_FORMAT_ERROR)
+        file.seek(0)
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                if width * height > RECIPE_IMAGE_MAX_PIXELS:
+                    raise serializers.ValidationError(IMAGE_PIXELS_ERROR)
+                image.verify()
+        except serializers.ValidationError:
+            raise
+        except Exception:
+            self.fail('invalid_image')
+        file.seek(0)
+
+
+class ImageVariantsField(serializers.Field):
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        storage = Recipe._meta.get_field('image').storage
+        request = self.context.get('request')
+        build_url = (
+            request.build_absolute_uri if request is not None
+            else (lambda url: url)
+        )
+        return {
+            name: {
+                extension: build_url(storage.url(path))
+                for extension, path in formats.items()
+            }
+            for name, formats in value.items()
+        }
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -44,7 +141,36 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        keys = list()
+        for pk in data:
+            try:
+                keys.append(int(pk))
+            except (TypeError, ValueError):
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(pk).__name__
+                )
+        objects = self.child_relation.get_queryset().in_bulk(keys)
+        for pk in keys:
+            if pk not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in keys]
+
+
 class TagPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
     def to_representation(self, value):
         return model_to_dict(value.tag)
 
@@ -55,9 +181,13 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
+def recipe_ingredient_to_dict(value):
+    return {**model_to_dict(value.ingredient), 'amount': value.amount}
+
+
 class IngredientPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
     def to_representation(self, value):
-        return model_to_dict(value.ingredient)
+        return recipe_ingredient_to_dict(value)
 
 
 class IngredientCreateSerializer(serializers.ModelSerializer):
@@ -65,16 +195,11 @@ class IngredientCreateSerializer(serializers.ModelSerializer):
     amount = serializers.IntegerField()
 
     class Meta:
-        model = Ingredient
+        model = RecipeIngredient
         fields = ('id', 'amount')
 
     def to_representation(self, value):
-        return model_to_dict(value.ingredient)
-
-    def validate_id(self, value):
-        if not Ingredient.objects.filter(id=value).exists():
-            raise serializers.ValidationError(NO_SUCH_INGREDIENTS_ERROR)
-        return value
+        return recipe_ingredient_to_dict(value)
 
     def validate_amount(self, value):
         if value < MIN_INGREDIENTS_AMOUNT:
@@ -100,15 +225,23 @@ class RecipeSerializer(serializers.ModelSerializer):
         method_name='get_is_in_shopping_cart'
     )
     image = Base64ImageField(allow_null=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients',
                   'is_favorited', 'is_in_shopping_cart',
-                  'name', 'image', 'text', 'cooking_time')
+                  'name', 'image', 'image_variants', 'text', 'cooking_time')
         extra_kwargs = {'ingredients': {'required': True}}
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'is_author_subscribed'):
+            instance.author.is_subscribed = instance.is_author_subscribed
+        return super().to_representation(instance)
+
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if self.context.get('request').user.id is None:
             return False
         return Favorite.objects.filter(
@@ -117,6 +250,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         ).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if self.context.get('request').user.id is None:
             return False
         return ShoppingCart.objects.filter(
@@ -128,6 +263,28 @@ class RecipeSerializer(serializers.ModelSerializer):
 class RecipeCreateSerializer(RecipeSerializer):
     ingredients = IngredientCreateSerializer(many=True)
 
+    def to_internal_value(self, data):
+        if hasattr(data, 'getlist'):
+            data = self.parse_form_data(data)
+        return super().to_internal_value(data)
+
+    def parse_form_data(self, data):
+        parsed = data.dict()
+        for name in ('tags', 'ingredients'):
+            values = data.getlist(name)
+            if len(values) != 1:
+                if values:
+                    parsed[name] = values
+                continue
+            try:
+                value = json.loads(values[0])
+            except ValueError:
+                raise serializers.ValidationError(
+                    {name: [INVALID_JSON_ERROR]}
+                )
+            parsed[name] = value if isinstance(value, list) else [value]
+        return parsed
+
     @transaction.atomic
     def create(self, validated_data):
         if 'ingredients' not in validated_data:
@@ -139,34 +296,93 @@ class RecipeCreateSerializer(RecipeSerializer):
         if 'image' not in validated_data:
             raise serializers.ValidationError(REQUIRED_IMAGE_ERROR)
         image = validated_data.pop('image')
-        recipe, _ = Recipe.objects.get_or_create(**validated_data)
-        recipe.image = image
-        recipe.save()
-        for tag in tags:
-            tag, _ = RecipeTag.objects.get_or_create(
-                recipe=recipe, tag=tag
-            )
-        for ingredient in ingredients:
-            id = ingredient.get('id')
-            amount = ingredient.get('amount')
-            table_ingredient = Ingredient.objects.get(id=id)
-            ingredient, _ = Ingredient.objects.get_or_create(
-                name=table_ingredient.name,
-                measurement_unit=table_ingredient.measurement_unit,
-                amount=amount
-            )
-            recipe_ingredient, _ = RecipeIngredient.objects.get_or_create(
-                recipe=recipe, ingredient=ingredient
-            )
+        recipe = Recipe.objects.create(image=image, **validated_data)
+        RecipeTag.objects.bulk_create(
+            RecipeTag(recipe=recipe, tag=tag) for tag in tags
+        )
+        self.create_ingredients(recipe, ingredients)
+        self.index_recipe(recipe, tags, ingredients)
+        schedule_image_variants(recipe.id)
         return recipe
 
+    def create_ingredients(self, recipe, ingredients):
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredient['ingredient'],
+                amount=ingredient['amount']
+            )
+            for ingredient in ingredients
+        )
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        recipe = Recipe.objects.get(id=instance.id)
-        validated_data['id'] = instance.id
-        validated_data['image'] = recipe.image
-        recipe.delete()
-        return self.create(validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if validated_data.get('image') is None:
+            validated_data.pop('image', None)
+        else:
+            validated_data['image_variants'] = {}
+            schedule_image_variants(instance.id)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save()
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        self.index_recipe(instance, tags, ingredients)
+        return instance
+
+    def index_recipe(self, recipe, tags=None, ingredients=None):
+        if tags is None:
+            tags = [link.tag for link in recipe.tags.all()]
+        if ingredients is None:
+            ingredients = [
+                link.ingredient for link in recipe.ingredients.all()
+            ]
+        else:
+            ingredients = [item['ingredient'] for item in ingredients]
+        index_recipe(recipe, (*tags, *ingredients))
+
+    def update_tags(self, recipe, tags):
+        current_tags = {link.tag_id for link in recipe.tags.all()}
+        new_tags = {tag.id for tag in tags}
+        if current_tags - new_tags:
+            RecipeTag.objects.filter(
+                recipe=recipe, tag_id__in=current_tags - new_tags
+            ).delete()
+        if new_tags - current_tags:
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe=recipe, tag_id=tag_id)
+                for tag_id in new_tags - current_tags
+            )
+
+    def update_ingredients(self, recipe, ingredients):
+        current_links = {
+            link.ingredient_id: link for link in recipe.ingredients.all()
+        }
+        new_amounts = {
+            ingredient['ingredient'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current_links.keys() - new_amounts.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        changed_links = list()
+        for ingredient_id, link in current_links.items():
+            amount = new_amounts.get(ingredient_id)
+            if amount is not None and link.amount != amount:
+                link.amount = amount
+                changed_links.append(link)
+        if changed_links:
+            RecipeIngredient.objects.bulk_update(changed_links, ('amount',))
+        self.create_ingredients(recipe, (
+            ingredient for ingredient in ingredients
+            if ingredient['ingredient'].id not in current_links
+        ))
 
     def validate_ingredients(self, value):
         if not value:
@@ -176,6 +392,11 @@ class RecipeCreateSerializer(RecipeSerializer):
             keys.append(ingredient.get('id'))
         if len(keys) > len(set(keys)):
             raise serializers.ValidationError(NOT_UNIQUE_INGREDIENTS_ERROR)
+        table_ingredients = Ingredient.objects.in_bulk(keys)
+        if len(table_ingredients) < len(keys):
+            raise serializers.ValidationError(NO_SUCH_INGREDIENTS_ERROR)
+        for ingredient in value:
+            ingredient['ingredient'] = table_ingredients[ingredient['id']]
         return value
 
     def validate_tags(self, value):
@@ -195,12 +416,31 @@ class RecipeCreateSerializer(RecipeSerializer):
         return value
 
 
+class RecipePantrySerializer(RecipeSerializer):
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + (
+            'matched_ingredients', 'coverage'
+        )
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=PANTRY_MAX_INGREDIENTS
+    )
+
+
 class RecipeSmallSerializer(serializers.ModelSerializer):
     image = Base64ImageField(required=False, allow_null=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_variants', 'cooking_time')
 
 
 class SubscribeSerializer(serializers.ModelSerializer):
@@ -210,9 +450,6 @@ class SubscribeSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField(
         method_name='get_is_subscribed'
     )
-    recipes_count = serializers.SerializerMethodField(
-        method_name='get_recipes_count'
-    )
 
     class Meta:
         model = User
@@ -224,12 +461,12 @@ class SubscribeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        return True
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return getattr(obj, 'is_subscribed', True)
 
     def get_recipes(self, obj):
-        recipes_limit = (self._context.get('recipes_limit'))
-        recipes = obj.recipes.all()[:recipes_limit]
+        if hasattr(obj, 'recent_recipes'):
+            recipes = obj.recent_recipes
+        else:
+            recipes_limit = (self._context.get('recipes_limit'))
+            recipes = obj.recipes.all()[:recipes_limit]
         return RecipeSmallSerializer(recipes, many=True).data
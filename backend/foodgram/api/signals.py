@@ -0,0 +1,114 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.cache import (
+    INGREDIENTS_CACHE_KEY, PANTRY_CACHE_KEY, TAG_SLUGS_CACHE_KEY,
+    TAGS_CACHE_KEY, invalidate_catalog
+)
+from api.pantry import pantry_index
+from food.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from food.search import index_recipes
+from users.models import User
+
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def is_deleted_with(origin, *models):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, models)
+
+
+def update_recipes_count(user_id, delta):
+    User.objects.filter(id=user_id).update(
+        recipes_count=F('recipes_count') + delta
+    )
+
+
+def update_recipe_counter(model, recipes, delta):
+    counter = RECIPE_COUNTERS[model]
+    recipes.touch(**{counter: F(counter) + delta})
+
+
+# Сбрасываем кеш только после коммита: иначе параллельный запрос успеет
+# собрать каталог из старых строк и сохранить его на CATALOG_CACHE_TIMEOUT.
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    transaction.on_commit(lambda: invalidate_catalog(INGREDIENTS_CACHE_KEY))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(**kwargs):
+    transaction.on_commit(invalidate_tag_caches)
+
+
+def invalidate_tag_caches():
+    invalidate_catalog(TAGS_CACHE_KEY)
+    cache.delete(TAG_SLUGS_CACHE_KEY)
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+@receiver((post_save, pre_delete), sender=Tag)
+def reindex_related_recipes(instance, created=False, **kwargs):
+    if created:
+        return
+    recipe_ids = list(instance.recipes.values_list('recipe_id', flat=True))
+    if recipe_ids:
+        transaction.on_commit(lambda: index_recipes(recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def record_pantry_change(instance, **kwargs):
+    recipe_id = instance.id
+    transaction.on_commit(lambda: pantry_index.record_change(recipe_id))
+
+
+@receiver(post_delete, sender=Ingredient)
+def invalidate_pantry(**kwargs):
+    transaction.on_commit(lambda: invalidate_catalog(PANTRY_CACHE_KEY))
+
+
+@receiver(post_save, sender=Recipe)
+def count_created_recipe(instance, created, **kwargs):
+    if created:
+        update_recipes_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def count_deleted_recipe(instance, origin=None, **kwargs):
+    # Счётчик удаляемого автора поправлять незачем.
+    if not is_deleted_with(origin, User):
+        update_recipes_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def count_created_relation(sender, instance, created, **kwargs):
+    if created:
+        update_recipe_counter(
+            sender, Recipe.objects.filter(id=instance.recipe_id), 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def count_deleted_relation(sender, instance, origin=None, **kwargs):
+    # Удаление рецепта уносит счётчики с собой, удаление пользователя
+    # обрабатывается одним запросом в count_deleted_user_relations.
+    if not is_deleted_with(origin, Recipe, User):
+        update_recipe_counter(
+            sender, Recipe.objects.filter(id=instance.recipe_id), -1
+        )
+
+
+@receiver(pre_delete, sender=User)
+def count_deleted_user_relations(instance, **kwargs):
+    for model in RECIPE_COUNTERS:
+        update_recipe_counter(model, Recipe.objects.filter(
+            id__in=model.objects.filter(user=instance).values('recipe_id')
+        ), -1)
@@ -0,0 +1,1153 @@
+import base64
+import json
+import math
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.autocomplete import IngredientIndex
+from api.budgets import get_query_budget, get_view_class
+from api.cache import (
+    INGREDIENTS_CACHE_KEY, PANTRY_CACHE_KEY, TAG_SLUGS_CACHE_KEY,
+    TAGS_CACHE_KEY, get_catalog_version, invalidate_catalog
+)
+from api.management.commands.seed_data import SEED_PASSWORD
+from api.middleware import metrics_registry
+from api.pantry import PantryIndex
+from api.urls import urlpatterns
+from food.counters import rebuild_counters
+from food.images import build_image_variants
+from food.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeRank, ShoppingCart,
+    Tag
+)
+from foodgram.settings import (
+    INGREDIENT_SEARCH_LIMIT, RANKING_TRENDING_GRAVITY, RECIPE_IMAGE_VARIANTS
+)
+from users.models import Subscription, User
+
+SEED_SIZES = (
+    {'users': 5, 'recipes': 20, 'favorites': 30, 'carts': 15,
+     'subscriptions': 5},
+    {'users': 40, 'recipes': 400, 'favorites': 1500, 'carts': 600,
+     'subscriptions': 150},
+)
+# Действия djoser, которыми Foodgram не пользуется.
+SKIPPED_ROUTES = {
+    'users-activation', 'users-resend-activation',
+    'users-reset-password', 'users-reset-password-confirm',
+    'users-reset-username', 'users-reset-username-confirm',
+    'users-set-username',
+}
+
+
+def iter_routes(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from iter_routes(pattern.url_patterns)
+        else:
+            yield pattern
+
+
+def get_project_routes():
+    return {
+        pattern.name for pattern in iter_routes(urlpatterns)
+        if pattern.name not in SKIPPED_ROUTES
+        and get_view_class(pattern.callback).__module__.startswith(
+            ('api.', 'users.')
+        )
+    }
+
+
+class APITestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.settings_override.enable()
+        buffer = BytesIO()
+        Image.new('RGB', (2, 2)).save(buffer, 'PNG')
+        cls.image = (
+            'data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode()
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='cook', email='cook@example.com', password='password',
+            first_name='Иван', last_name='Иванов'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тэг {number}', slug=f'tag-{number}',
+                color=f'#00000{number}')
+            for number in range(3)
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(30)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}'
+        )
+
+    def create_recipes(self, count, ingredients_count=5):
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=self.user, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipe/images/recipe.png'
+            )
+            for number in range(count)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=self.ingredients[
+                    (number + offset) % len(self.ingredients)
+                ],
+                amount=offset + 1
+            )
+            for number, recipe in enumerate(recipes)
+            for offset in range(ingredients_count)
+        )
+        self.rebuild_counters()
+        return recipes
+
+    def rebuild_counters(self):
+        rebuild_counters(Recipe, Favorite, ShoppingCart, User)
+
+    def create_recipe(self, ingredients_count, client=None, **data):
+        return (client or self.client).post('/api/recipes/', {
+            'name': f'Рецепт из {ingredients_count}',
+            'text': 'Описание',
+            'cooking_time': 10,
+            'image': self.image,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 1}
+                for ingredient in self.ingredients[:ingredients_count]
+            ],
+            **data,
+        }, format='json')
+
+    def create_client(self, username):
+        user = User.objects.create_user(
+            username=username, email=f'{username}@example.com',
+            password='password'
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.create(user=user).key
+        ))
+        return user, client
+
+
+class ShoppingCartDownloadTests(APITestCase):
+    def download(self, format=None):
+        path = '/api/recipes/download_shopping_cart/'
+        if format is not None:
+            path += f'?format={format}'
+        response = self.client.get(path)
+        if response.status_code != 200:
+            return response, None
+        return response, b''.join(response.streaming_content)
+
+    def fill_cart(self, count):
+        ShoppingCart.objects.all().delete()
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe)
+            for recipe in self.create_recipes(count)
+        )
+        self.rebuild_counters()
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for count in (1, 50):
+            with self.subTest(recipes=count):
+                self.fill_cart(count)
+                with self.assertNumQueries(2):
+                    response, content = self.download()
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('Ингредиент 0 (г)', content.decode())
+
+    def test_formats(self):
+        self.fill_cart(2)
+        for format, content_type in (
+            (None, 'text/plain; charset=UTF-8'),
+            ('txt', 'text/plain; charset=UTF-8'),
+            ('csv', 'text/csv; charset=UTF-8'),
+            ('pdf', 'application/pdf'),
+        ):
+            with self.subTest(format=format):
+                response, content = self.download(format)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['Content-Type'], content_type)
+                self.assertIn(
+                    f'shopping_cart.{format or "txt"}',
+                    response['Content-Disposition']
+                )
+                if format == 'pdf':
+                    self.assertTrue(content.startswith(b'%PDF'))
+                    self.assertTrue(content.rstrip().endswith(b'%%EOF'))
+                elif format == 'csv':
+                    rows = content.decode().splitlines()
+                    self.assertEqual(
+                        rows[0], 'Ингредиент,Единица измерения,Количество'
+                    )
+                    self.assertIn('Ингредиент 0,г,1', rows)
+                else:
+                    self.assertIn(
+                        '*** Ингредиент 0 (г) -- 1', content.decode()
+                    )
+
+    def test_unknown_format(self):
+        response, _ = self.download('docx')
+        self.assertEqual(response.status_code, 400)
+
+    def test_anonymous(self):
+        self.client.credentials()
+        response, _ = self.download()
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeCreateTests(APITestCase):
+    def test_query_count_does_not_depend_on_ingredients(self):
+        for count in (3, 20):
+            with self.subTest(ingredients=count):
+                with self.assertNumQueries(13):
+                    response = self.create_recipe(count)
+                self.assertEqual(response.status_code, 201)
+                self.assertEqual(len(response.data['ingredients']), count)
+
+    def test_line_wrapped_base64_image(self):
+        header, encoded = self.image.split(',')
+        wrapped = base64.encodebytes(base64.b64decode(encoded)).decode()
+        for chunk_size in (7, 64 * 1024):
+            with self.subTest(chunk_size=chunk_size), mock.patch(
+                'api.serializers.BASE64_CHUNK_SIZE', chunk_size
+            ):
+                self.image = f'{header},{wrapped}'
+                self.assertEqual(self.create_recipe(3).status_code, 201)
+                self.image = f'{header},{wrapped[:-4]}'
+                self.assertEqual(self.create_recipe(3).status_code, 400)
+
+
+class RecipeUpdateTests(APITestCase):
+    def test_patch_ingredients_keeps_recipe_and_relations(self):
+        recipe = Recipe.objects.get(id=self.create_recipe(3).data['id'])
+        guest, guest_client = self.create_client('guest')
+        path = f'/api/recipes/{recipe.id}/'
+        self.assertEqual(
+            guest_client.post(f'{path}favorite/').status_code, 201
+        )
+        self.assertEqual(
+            guest_client.post(f'{path}shopping_cart/').status_code, 201
+        )
+        first, second, third, fourth = self.ingredients[:4]
+        links = {
+            link.ingredient_id: link for link in recipe.ingredients.all()
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.patch(path, {'ingredients': [
+                {'id': first.id, 'amount': 1},
+                {'id': second.id, 'amount': 7},
+                {'id': fourth.id, 'amount': 2},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query['sql'].split()[0] for query in queries.captured_queries
+            if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+            and '"food_recipeingredient"' in query['sql'].split('(')[0]
+        ]
+        self.assertEqual(sorted(writes), ['DELETE', 'INSERT', 'UPDATE'])
+        updated = Recipe.objects.get(id=recipe.id)
+        self.assertEqual(updated.pub_date, recipe.pub_date)
+        self.assertEqual(updated.image.name, recipe.image.name)
+        self.assertEqual(
+            (updated.favorites_count, updated.in_carts_count), (1, 1)
+        )
+        self.assertTrue(Favorite.objects.filter(
+            user=guest, recipe=recipe
+        ).exists())
+        self.assertTrue(ShoppingCart.objects.filter(
+            user=guest, recipe=recipe
+        ).exists())
+        current = {
+            link.ingredient_id: link for link in updated.ingredients.all()
+        }
+        self.assertEqual(
+            {id: link.amount for id, link in current.items()},
+            {first.id: 1, second.id: 7, fourth.id: 2}
+        )
+        self.assertNotIn(third.id, current)
+        # Неизменённая и изменённая связи остаются теми же строками.
+        self.assertEqual(current[first.id].id, links[first.id].id)
+        self.assertEqual(current[second.id].id, links[second.id].id)
+        self.assertEqual(
+            [item['amount'] for item in response.data['ingredients']
+             if item['id'] == second.id],
+            [7]
+        )
+
+    def test_patch_without_image_keeps_image(self):
+        recipe = Recipe.objects.get(id=self.create_recipe(2).data['id'])
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/', {'name': 'Новое название'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Новое название')
+        self.assertEqual(response.data['id'], recipe.id)
+        self.assertTrue(recipe.image.name)
+        self.assertEqual(recipe.ingredients.count(), 2)
+
+
+@mock.patch('food.images.RECIPE_IMAGE_WORKERS', 0)
+class ImageVariantsTests(APITestCase):
+    def create_recipe_with_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (800, 500), 'red').save(buffer, 'PNG')
+        return self.create_recipe(3, image=(
+            'data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode()
+        ))
+
+    def test_variants_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.create_recipe_with_image()
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['image_variants'], {})
+        recipe = Recipe.objects.get(id=response.data['id'])
+        storage = recipe.image.storage
+        self.assertEqual(
+            set(recipe.image_variants), set(RECIPE_IMAGE_VARIANTS)
+        )
+        for name, formats in recipe.image_variants.items():
+            self.assertEqual(set(formats), {'webp', 'jpeg'})
+            for extension, path in formats.items():
+                with self.subTest(variant=name, format=extension):
+                    self.assertTrue(storage.exists(path))
+                    with storage.open(path) as file, \
+                            Image.open(file) as image:
+                        self.assertEqual(
+                            image.format, extension.upper()
+                        )
+                        self.assertEqual(
+                            image.width, RECIPE_IMAGE_VARIANTS[name][0]
+                        )
+        variants = self.client.get(
+            f'/api/recipes/{recipe.id}/'
+        ).data['image_variants']
+        self.assertEqual(variants, {
+            name: {
+                extension: f'http://testserver{storage.url(path)}'
+                for extension, path in formats.items()
+            }
+            for name, formats in recipe.image_variants.items()
+        })
+
+    def test_variants_of_replaced_image_are_dropped(self):
+        def replace_image(field_file):
+            # Пока строятся варианты, рецепт получает новое изображение.
+            variants = build_image_variants(field_file)
+            Recipe.objects.update(image='recipe/images/other.png')
+            return variants
+
+        with mock.patch(
+            'food.images.build_image_variants', side_effect=replace_image
+        ) as build:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.create_recipe_with_image()
+        build.assert_called_once()
+        recipe = Recipe.objects.get(id=response.data['id'])
+        self.assertEqual(recipe.image.name, 'recipe/images/other.png')
+        self.assertEqual(recipe.image_variants, {})
+
+
+class RecipeRetrieveTests(APITestCase):
+    def test_invalid_id_returns_not_found(self):
+        response = self.client.get('/api/recipes/abc/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_etag_changes_when_tag_is_renamed(self):
+        recipe, = self.create_recipes(1)
+        recipe.tags.create(tag=self.tags[0])
+        url = f'/api/recipes/{recipe.id}/'
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        self.tags[0].name = 'Новое имя'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['tags'][0]['name'], 'Новое имя')
+
+
+class RecipeAuthorETagTests(APITestCase):
+    def test_etag_changes_when_author_is_renamed(self):
+        recipe, = self.create_recipes(1)
+        for path in (f'/api/recipes/{recipe.id}/', '/api/recipes/'):
+            with self.subTest(path=path):
+                etag = self.client.get(path).headers['ETag']
+                self.assertEqual(self.client.get(
+                    path, HTTP_IF_NONE_MATCH=etag
+                ).status_code, 304)
+                User.objects.filter(id=self.user.id).update(
+                    first_name=f'Пётр {len(path)}'
+                )
+                response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotEqual(response.headers['ETag'], etag)
+
+
+class CursorPaginationTests(APITestCase):
+    def walk(self, path, link='next'):
+        pages = list()
+        while path:
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            pages.append([item['id'] for item in response.data['results']])
+            path = response.data[link]
+        return pages
+
+    def test_recipes_with_equal_pub_date(self):
+        recipes = self.create_recipes(23)
+        tied = timezone.now() - timedelta(days=1)
+        Recipe.objects.filter(
+            id__in=[recipe.id for recipe in recipes[5:20]]
+        ).update(pub_date=tied)
+        expected = list(Recipe.objects.order_by(
+            '-pub_date', '-id'
+        ).values_list('id', flat=True))
+        pages = self.walk('/api/recipes/?pagination=cursor&limit=4')
+        self.assertEqual(sum(pages, []), expected)
+        self.assertEqual(len(pages), 6)
+        last_page = self.client.get(
+            '/api/recipes/?pagination=cursor&limit=4'
+        )
+        while last_page.data['next']:
+            last_page = self.client.get(last_page.data['next'])
+        back = self.walk(last_page.data['previous'], 'previous')
+        self.assertEqual(sum(reversed(back), []), expected[:20])
+        self.assertTrue(all(len(page) == 4 for page in back))
+
+    def test_invalid_cursor(self):
+        for cursor in ('cD0x', 'cD1ub3QtYS1kYXRlfDE='):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get(
+                    f'/api/recipes/?cursor={cursor}'
+                ).status_code, 404)
+
+    def test_subscriptions(self):
+        authors = User.objects.bulk_create(
+            User(username=f'author-{number}',
+                 email=f'author-{number}@example.com')
+            for number in range(11)
+        )
+        Subscription.objects.bulk_create(
+            Subscription(user=author, subscriber=self.user)
+            for author in authors
+        )
+        pages = self.walk(
+            '/api/users/subscriptions/?pagination=cursor&limit=3'
+        )
+        self.assertEqual(
+            sum(pages, []), sorted(author.id for author in authors)
+        )
+        self.assertEqual(len(pages), 4)
+
+
+class CatalogCacheTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        invalidate_catalog(TAGS_CACHE_KEY)
+        invalidate_catalog(INGREDIENTS_CACHE_KEY)
+
+    def assert_refreshed_after_commit(self, path, change, name):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+        self.assertEqual(
+            self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+            # До коммита каталог ещё не сброшен.
+            self.assertEqual(
+                self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code,
+                304
+            )
+        response = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        self.assertIn(name, [item['name'] for item in response.json()])
+
+    def test_tag_change(self):
+        tag = self.tags[0]
+        tag.name = 'Завтрак'
+        self.assert_refreshed_after_commit('/api/tags/', tag.save, 'Завтрак')
+
+    def test_ingredient_change(self):
+        self.assert_refreshed_after_commit(
+            '/api/ingredients/',
+            lambda: Ingredient.objects.create(
+                name='Шафран', measurement_unit='г'
+            ),
+            'Шафран'
+        )
+
+
+class TagFilterTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.delete(TAG_SLUGS_CACHE_KEY)
+
+    def get_ids(self, *slugs):
+        query = '&'.join(f'tags={slug}' for slug in slugs)
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(response.data['count'], len(ids))
+        return ids
+
+    def test_tags_are_combined_with_or(self):
+        both, first, untagged = self.create_recipes(3)
+        both.tags.create(tag=self.tags[0])
+        both.tags.create(tag=self.tags[1])
+        first.tags.create(tag=self.tags[0])
+        self.assertEqual(
+            sorted(self.get_ids('tag-0', 'tag-1')),
+            sorted((both.id, first.id))
+        )
+        self.assertEqual(self.get_ids('tag-1'), [both.id])
+        self.assertEqual(self.get_ids('tag-2'), [])
+
+    def test_unknown_slug(self):
+        recipe, = self.create_recipes(1)
+        recipe.tags.create(tag=self.tags[0])
+        self.assertEqual(self.get_ids('unknown'), [])
+        self.assertEqual(self.get_ids('unknown', 'tag-0'), [recipe.id])
+
+    def test_tag_slug_cache_follows_rename(self):
+        tag = self.tags[0]
+        recipe, = self.create_recipes(1)
+        recipe.tags.create(tag=tag)
+        path = '/api/recipes/?tags={}'
+        self.assertEqual(
+            self.client.get(path.format(tag.slug)).data['count'], 1
+        )
+        tag.slug = 'breakfast'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+        self.assertEqual(
+            self.client.get(path.format('breakfast')).data['count'], 1
+        )
+        self.assertEqual(
+            self.client.get(path.format('tag-0')).data['count'], 0
+        )
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.delete(TAG_SLUGS_CACHE_KEY)
+        self.title, self.text, self.other = (
+            self.create_recipe(
+                3, name=name, text=text, tags=[self.tags[tag].id]
+            ).data['id']
+            for name, text, tag in (
+                ('Борщ', 'Суп со свёклой', 0),
+                ('Суп дня', 'Настоящий борщ по-украински', 1),
+                ('Каша', 'Гречневая', 0),
+            )
+        )
+
+    def search(self, query, **params):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_matches_are_ranked(self):
+        # Совпадение в названии весит больше, чем в описании.
+        self.assertEqual(self.search('борщ'), [self.title, self.text])
+        self.assertEqual(self.search('БОРЩ'), [self.title, self.text])
+        self.assertEqual(self.search('бор'), [self.title, self.text])
+        self.assertEqual(self.search('суп свёкла'), [])
+        self.assertEqual(self.search('суп свёклой'), [self.title])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_search_with_filters(self):
+        self.assertEqual(self.search('борщ', tags='tag-1'), [self.text])
+        self.client.post(f'/api/recipes/{self.text}/favorite/')
+        self.assertEqual(
+            self.search('борщ', is_favorited=1), [self.text]
+        )
+
+    def test_ranked_results_use_page_numbers(self):
+        for params in (
+            {'search': 'борщ'}, {'ordering': 'popular'},
+        ):
+            with self.subTest(**params):
+                response = self.client.get('/api/recipes/', {
+                    'pagination': 'cursor', 'limit': 1, **params
+                })
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.data['count'], 2 if 'search' in params else 3
+                )
+                self.assertIn('page=2', response.data['next'])
+        response = self.client.get(
+            '/api/recipes/', {'pagination': 'cursor', 'limit': 1}
+        )
+        self.assertIsNone(response.data['count'])
+        self.assertIn('cursor=', response.data['next'])
+
+    def test_tag_rename_is_searchable_after_commit(self):
+        tag = self.tags[0]
+        tag.name = 'Завтрак'
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.save()
+            self.assertEqual(self.search('завтрак'), [])
+        self.assertEqual(
+            sorted(self.search('завтрак')), sorted((self.title, self.other))
+        )
+
+
+class CounterTests(APITestCase):
+    def refresh(self, *objects):
+        for obj in objects:
+            obj.refresh_from_db()
+
+    def test_recipes_count_follows_orm_create_and_delete(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipe/images/recipe.png'
+        )
+        self.refresh(self.user)
+        self.assertEqual(self.user.recipes_count, 1)
+        Recipe.objects.filter(id=recipe.id).delete()
+        self.refresh(self.user)
+        self.assertEqual(self.user.recipes_count, 0)
+
+    def test_api_relations_are_counted_once(self):
+        recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipe/images/recipe.png'
+        )
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.refresh(recipe)
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.refresh(recipe)
+        self.assertEqual(recipe.favorites_count, 0)
+
+    def test_user_deletion_releases_counters(self):
+        recipe, = self.create_recipes(1)
+        guest = User.objects.create_user(
+            username='guest', email='guest@example.com', password='password'
+        )
+        Favorite.objects.create(user=guest, recipe=recipe)
+        ShoppingCart.objects.create(user=guest, recipe=recipe)
+        self.refresh(recipe)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1)
+        )
+        User.objects.filter(id=guest.id).delete()
+        self.refresh(recipe)
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (0, 0)
+        )
+
+
+class RecipeRelationTests(APITestCase):
+    RELATIONS = (
+        ('favorite', Favorite, 'favorites_count'),
+        ('shopping_cart', ShoppingCart, 'in_carts_count'),
+    )
+
+    def test_duplicate_and_missing_relations(self):
+        recipe, = self.create_recipes(1)
+        for path, model, counter in self.RELATIONS:
+            with self.subTest(path=path):
+                url = f'/api/recipes/{recipe.id}/{path}/'
+                self.assertEqual(self.client.post(url).status_code, 201)
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(model.objects.filter(
+                    user=self.user, recipe=recipe
+                ).count(), 1)
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 1)
+                self.assertEqual(self.client.delete(url).status_code, 204)
+                self.assertEqual(self.client.delete(url).status_code, 400)
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 0)
+
+    def test_missing_recipe(self):
+        for path, _, _ in self.RELATIONS:
+            with self.subTest(path=path):
+                url = f'/api/recipes/0/{path}/'
+                self.assertEqual(self.client.post(url).status_code, 400)
+                self.assertEqual(self.client.delete(url).status_code, 404)
+
+    def test_unique_constraints(self):
+        recipe, = self.create_recipes(1)
+        for path, model, counter in self.RELATIONS:
+            with self.subTest(path=path):
+                model.objects.create(user=self.user, recipe=recipe)
+                with self.assertRaises(IntegrityError):
+                    with transaction.atomic():
+                        model.objects.create(user=self.user, recipe=recipe)
+                recipe.refresh_from_db()
+                self.assertEqual(getattr(recipe, counter), 1)
+
+
+class RequestMetricsTests(APITestCase):
+    def setUp(self):
+        # Флаг читается из настроек при импорте, как и остальные.
+        patcher = mock.patch('api.middleware.REQUEST_METRICS', True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp()
+        metrics_registry.reset()
+
+    def get_log(self, path):
+        with self.assertLogs('foodgram.metrics', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(path)
+                content = (
+                    b''.join(response.streaming_content)
+                    if response.streaming else response.content
+                )
+        self.assertEqual(response.status_code, 200)
+        metrics = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(metrics['queries'], len(queries))
+        self.assertEqual(metrics['size'], len(content))
+        return response, metrics
+
+    def test_server_timing_and_log(self):
+        response, metrics = self.get_log('/api/tags/')
+        self.assertEqual(metrics['view'], 'api:tags')
+        self.assertEqual(metrics['budget'], 2)
+        timing = response.headers['Server-Timing']
+        for name in ('db', 'app', 'render', 'total'):
+            self.assertIn(f'{name};dur=', timing)
+        self.assertIn(f'desc="{metrics["queries"]} queries"', timing)
+        self.assertLessEqual(
+            metrics['db_ms'] + metrics['app_ms'] + metrics['render_ms'],
+            metrics['total_ms'] + 0.01
+        )
+
+    def test_streaming_queries_are_counted(self):
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe)
+            for recipe in self.create_recipes(2)
+        )
+        self.rebuild_counters()
+        response, metrics = self.get_log(
+            '/api/recipes/download_shopping_cart/'
+        )
+        self.assertEqual(metrics['queries'], 2)
+        # Заголовок отправлен до тела, поэтому в нём только запросы до него.
+        self.assertIn('desc="1 queries"', response.headers['Server-Timing'])
+
+    def test_histograms_are_admin_only(self):
+        self.get_log('/api/tags/')
+        self.get_log('/api/tags/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        admin, client = self.create_client('admin')
+        User.objects.filter(id=admin.id).update(is_staff=True)
+        response = client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        tags = response.data['api:tags']
+        self.assertEqual(tags['requests'], 2)
+        self.assertEqual(sum(tags['queries']['buckets'].values()), 2)
+        self.assertEqual(
+            set(tags),
+            {'requests', 'latency_ms', 'db_ms', 'app_ms', 'render_ms',
+             'queries', 'response_bytes'}
+        )
+        self.assertEqual(client.delete('/api/metrics/').status_code, 204)
+        self.assertNotIn('api:tags', metrics_registry.snapshot())
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+
+
+class RankingTests(APITestCase):
+    def update_rankings(self, *args):
+        stdout = StringIO()
+        call_command('update_rankings', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def get_ids(self, ordering):
+        response = self.client.get(f'/api/recipes/?ordering={ordering}')
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def test_rankings_order_recipes(self):
+        older, newer, quiet = self.create_recipes(3)
+        guests = User.objects.bulk_create(
+            User(username=f'guest-{number}',
+                 email=f'guest-{number}@example.com')
+            for number in range(3)
+        )
+        for guest in guests:
+            Favorite.objects.create(user=guest, recipe=older)
+        Favorite.objects.create(user=guests[0], recipe=newer)
+        ShoppingCart.objects.create(user=guests[0], recipe=newer)
+        # Старое избранное входит в популярность, но не в тренд.
+        Favorite.objects.filter(recipe=older).exclude(
+            user=guests[0]
+        ).update(created=timezone.now() - timedelta(days=30))
+        self.assertIn('Пересчитано рейтингов: 3', self.update_rankings())
+        unranked, = self.create_recipes(1)
+        ranks = {
+            rank.recipe_id: rank for rank in RecipeRank.objects.all()
+        }
+        self.assertEqual(
+            [ranks[recipe.id].popular for recipe in (older, newer, quiet)],
+            [3, 1.5, 0]
+        )
+        newer.refresh_from_db()
+        self.assertAlmostEqual(
+            ranks[newer.id].trending,
+            math.log10(2.5)
+            + newer.pub_date.timestamp() / RANKING_TRENDING_GRAVITY
+        )
+        self.assertEqual(
+            (ranks[older.id].favorites_recent, ranks[older.id].carts_recent),
+            (1, 0)
+        )
+        self.assertEqual(
+            self.get_ids('popular'),
+            [older.id, newer.id, quiet.id, unranked.id]
+        )
+        self.assertEqual(
+            self.get_ids('trending'),
+            [newer.id, older.id, quiet.id, unranked.id]
+        )
+
+    def test_incremental_update_skips_unchanged_recipes(self):
+        active, quiet, edited = self.create_recipes(3)
+        Favorite.objects.create(user=self.user, recipe=active)
+        self.update_rankings()
+        computed_at = dict(
+            RecipeRank.objects.values_list('recipe', 'computed_at')
+        )
+        Recipe.objects.filter(id=edited.id).touch()
+        added, = self.create_recipes(1)
+        self.assertIn('Пересчитано рейтингов: 3', self.update_rankings())
+        ranks = dict(RecipeRank.objects.values_list('recipe', 'computed_at'))
+        self.assertEqual(ranks[quiet.id], computed_at[quiet.id])
+        for recipe in (active, edited):
+            self.assertGreater(ranks[recipe.id], computed_at[recipe.id])
+        self.assertIn(added.id, ranks)
+        self.assertIn(
+            'Пересчитано рейтингов: 4', self.update_rankings('--full')
+        )
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']
+)
+class QueryBudgetTests(APITestCase):
+    def seed(self, number, size):
+        prefix = f'size{number}'
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                'seed_data', prefix=prefix, seed=number, stdout=StringIO(),
+                **size
+            )
+        user = User.objects.filter(
+            username__startswith=prefix
+        ).order_by('-recipes_count', 'id').first()
+        user.is_staff = True
+        user.save(update_fields=('is_staff',))
+        self.client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=user)[0].key
+        ))
+        return prefix, user
+
+    def request(self, method, path, data=None, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(path, data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+        name = f'{method.upper()} {path}'
+        self.assertLess(response.status_code, 400, name)
+        budget = get_query_budget(response.resolver_match, method)
+        self.assertIsNotNone(budget, f'{name}: бюджет не задан')
+        self.assertLessEqual(len(queries), budget, name)
+        self.routes.add(response.resolver_match.url_name)
+        return response
+
+    def test_routes_stay_within_query_budget(self):
+        for number, size in enumerate(SEED_SIZES):
+            with self.subTest(**size):
+                self.routes = set()
+                prefix, user = self.seed(number, size)
+                self.check_routes(prefix, user)
+                self.assertEqual(self.routes, get_project_routes())
+
+    def check_routes(self, prefix, user):
+        recipe = Recipe.objects.filter(author=user).first()
+        other = Recipe.objects.exclude(favorites__user=user).exclude(
+            shopping_carts__user=user
+        ).first()
+        author = User.objects.filter(
+            username__startswith=prefix
+        ).exclude(id=user.id).exclude(
+            subscribers__subscriber=user
+        ).first()
+        tag = Tag.objects.first()
+        ingredients = Ingredient.objects.all()[:3]
+        for path in (
+            '/api/ingredients/', f'/api/ingredients/{ingredients[0].id}/',
+            '/api/ingredients/?name=Ин', '/api/tags/', f'/api/tags/{tag.id}/',
+            '/api/users/subscriptions/?recipes_limit=3&limit=50',
+            '/api/recipes/?limit=50', f'/api/recipes/?tags={tag.slug}',
+            '/api/recipes/?pagination=cursor&limit=50',
+            '/api/recipes/?search=рецепт', f'/api/recipes/{recipe.id}/',
+            '/api/recipes/pantry/?' + '&'.join(
+                f'ingredients={ingredient.id}' for ingredient in ingredients
+            ),
+            '/api/recipes/download_shopping_cart/', '/api/metrics/',
+            '/api/users/?limit=50', f'/api/users/{author.id}/',
+            '/api/users/me/',
+        ):
+            self.request('get', path)
+        for path in (
+            f'/api/users/{author.id}/subscribe/',
+            f'/api/recipes/{other.id}/favorite/',
+            f'/api/recipes/{other.id}/shopping_cart/',
+        ):
+            self.request('post', path)
+            self.request('delete', path)
+        self.request('delete', '/api/metrics/')
+        self.check_recipe_writes(ingredients)
+        self.check_accounts(prefix, user)
+
+    def check_recipe_writes(self, ingredients):
+        data = {
+            'name': 'Рецепт', 'text': 'Описание', 'cooking_time': 10,
+            'image': self.image, 'tags': [Tag.objects.first().id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 1}
+                for ingredient in ingredients
+            ],
+        }
+        path = '/api/recipes/{}/'.format(
+            self.request('post', '/api/recipes/', data).data['id']
+        )
+        self.request('put', path, data)
+        self.request('patch', path, {'cooking_time': 20})
+        self.request('delete', path)
+
+    def check_accounts(self, prefix, user):
+        self.request('post', '/api/users/set_password/', {
+            'current_password': SEED_PASSWORD,
+            'new_password': 'Fresh-password-42',
+        })
+        guest = APIClient()
+        self.request('post', '/api/users/', {
+            'email': f'{prefix}-guest@example.com',
+            'username': f'{prefix}-guest', 'first_name': 'Гость',
+            'last_name': 'Гостев', 'password': 'Guest-password-42',
+        }, guest)
+        token = self.request('post', '/api/auth/token/login/', {
+            'email': f'{prefix}-guest@example.com',
+            'password': 'Guest-password-42',
+        }, guest).data['auth_token']
+        guest.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        self.request('post', '/api/auth/token/logout/', client=guest)
+
+
+class PantryIndexTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        invalidate_catalog(PANTRY_CACHE_KEY)
+        self.index = PantryIndex()
+        self.create_recipes(3)
+        self.match()
+
+    def match(self):
+        matches = self.index.match(
+            [ingredient.id for ingredient in self.ingredients]
+        )
+        return {recipe_id for recipe_id, _, _ in matches[:len(matches)]}
+
+    def test_gap_in_change_log_rebuilds_index(self):
+        recipes = self.create_recipes(2)
+        for recipe in recipes:
+            self.index.record_change(recipe.id)
+        version = get_catalog_version(PANTRY_CACHE_KEY)
+        cache.delete(self.index.get_change_key(
+            version, cache.get(self.index.get_sequence_key(version)) - 1
+        ))
+        self.assertLessEqual({recipe.id for recipe in recipes}, self.match())
+
+    def test_lost_increment_invalidates_log(self):
+        first, second = self.create_recipes(2)
+        version = get_catalog_version(PANTRY_CACHE_KEY)
+        sequence_key = self.index.get_sequence_key(version)
+        self.index.record_change(first.id)
+        # Второй процесс прочитал тот же номер до записи первого.
+        cache.decr(sequence_key)
+        self.index.record_change(second.id)
+        self.assertNotEqual(get_catalog_version(PANTRY_CACHE_KEY), version)
+        self.assertLessEqual({first.id, second.id}, self.match())
+
+
+class PantryEndpointTests(APITestCase):
+    # Ингредиенты рецептов; в запросе — ингредиенты 0, 1 и 2.
+    RECIPES = ((0, 1), (0, 1, 2, 3), (0, 3), (1, 4), (0, 1, 2, 5, 6, 7), (5,))
+
+    def setUp(self):
+        super().setUp()
+        invalidate_catalog(PANTRY_CACHE_KEY)
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=self.user, name=f'Рецепт {number}', text='Описание',
+                cooking_time=10, image='recipe/images/recipe.png'
+            )
+            for number in range(len(self.RECIPES))
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=self.ingredients[index], amount=1
+            )
+            for recipe, indexes in zip(recipes, self.RECIPES)
+            for index in indexes
+        )
+        self.rebuild_counters()
+        self.ids = [recipe.id for recipe in recipes]
+        self.path = '/api/recipes/pantry/?' + '&'.join(
+            f'ingredients={ingredient.id}'
+            for ingredient in self.ingredients[:3]
+        )
+
+    def get_results(self, path):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response.data, [
+            (item['id'], item['matched_ingredients'], item['coverage'])
+            for item in response.data['results']
+        ]
+
+    def test_order(self):
+        data, results = self.get_results(self.path)
+        self.assertEqual(data['count'], 5)
+        # Сначала полнота, затем число совпадений, затем новые рецепты.
+        self.assertEqual(results, [
+            (self.ids[0], 2, 1.0),
+            (self.ids[1], 3, 0.75),
+            (self.ids[4], 3, 0.5),
+            (self.ids[3], 1, 0.5),
+            (self.ids[2], 1, 0.5),
+        ])
+
+    def test_pagination(self):
+        _, expected = self.get_results(self.path)
+        pages = list()
+        path = f'{self.path}&limit=2'
+        while path:
+            data, results = self.get_results(path)
+            self.assertEqual(data['count'], 5)
+            pages.append(results)
+            path = data['next']
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_invalid_ingredients(self):
+        for path in (
+            '/api/recipes/pantry/', '/api/recipes/pantry/?ingredients=abc',
+            '/api/recipes/pantry/?ingredients=0',
+        ):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('ingredients', response.data)
+
+    def test_ingredient_deletion_rebuilds_index_after_commit(self):
+        self.get_results(self.path)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.ingredients[4].delete()
+        _, results = self.get_results(self.path)
+        self.assertIn((self.ids[3], 1, 1.0), results)
+
+
+class IngredientIndexTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ('Соль', 'Морская соль', 'Солод', 'Фасоль')
+        )
+
+    def setUp(self):
+        super().setUp()
+        invalidate_catalog(INGREDIENTS_CACHE_KEY)
+        self.index = IngredientIndex()
+
+    def names(self, query, limit=10):
+        return [item['name'] for item in self.index.search(query, limit)]
+
+    def test_prefix_matches_come_before_substring_matches(self):
+        self.assertEqual(
+            self.names('сол'), ['Солод', 'Соль', 'Морская соль', 'Фасоль']
+        )
+
+    def test_search_ignores_case(self):
+        self.assertEqual(self.names('СОЛЬ'), self.names('соль'))
+        self.assertEqual(self.names('соль')[0], 'Соль')
+
+    def test_limit(self):
+        self.assertEqual(len(self.names('ингредиент', 5)), 5)
+        self.assertEqual(
+            self.names('сол', 3), ['Солод', 'Соль', 'Морская соль']
+        )
+        response = self.client.get('/api/ingredients/?name=ингр')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), INGREDIENT_SEARCH_LIMIT)
+        self.assertEqual(
+            set(response.data[0]), {'id', 'name', 'measurement_unit'}
+        )
+
+    def test_index_is_rebuilt_after_catalog_change(self):
+        self.assertEqual(self.names('солонина'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='Солонина', measurement_unit='г'
+            )
+        self.assertEqual(self.names('солонина'), ['Солонина'])
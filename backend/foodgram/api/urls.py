@@ -1,10 +1,13 @@
-from django.urls import include, path
+from django.urls import include, path, re_path
 from rest_framework.routers import SimpleRouter
 
 from api.views import APITag, APIIngredient
 from api.views import APIFavorite
 from api.views import APIShoppingCart, RecipeViewSet
-from users.views import APISubscription, UserViewSet
+from api.views import APIMetrics
+from users.views import (
+    APISubscription, TokenCreateView, TokenDestroyView, UserViewSet
+)
 
 app_name = 'api'
 
@@ -28,8 +31,12 @@ urlpatterns = [
          name='shopping_cart'),
     path('recipes/download_shopping_cart/', APIShoppingCart.as_view(),
          name='download_shopping_cart'),
+    path('metrics/', APIMetrics.as_view(), name='metrics'),
     path('', include(router_api.urls)),
     path('', include('djoser.urls')),
 
-    path('auth/', include('djoser.urls.authtoken')),
+    re_path(r'^auth/token/login/?$', TokenCreateView.as_view(),
+            name='login'),
+    re_path(r'^auth/token/logout/?$', TokenDestroyView.as_view(),
+            name='logout'),
 ]
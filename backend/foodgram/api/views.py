@@ -1,35 +1,86 @@
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 
 from food.models import (
-    Tag, Recipe, Ingredient, Favorite, ShoppingCart, RecipeIngredient
+    Tag, Recipe, Ingredient, Favorite, ShoppingCart, RecipeIngredient,
+    RecipeTag
 )
 from api.serializers import (
     TagSerializer, RecipeSerializer,
     IngredientSerializer, RecipeSmallSerializer,
-    RecipeCreateSerializer
+    RecipeCreateSerializer, RecipePantrySerializer, PantrySerializer
+)
+from api.autocomplete import ingredient_index
+from api.cache import (
+    INGREDIENTS_CACHE_KEY, TAGS_CACHE_KEY, get_catalog_response
+)
+from api.core import (
+    SHOPPING_CART_EXPORTERS, get_shopping_cart_ingredients
+)
+from api.middleware import metrics_registry
+from api.pantry import pantry_index
+from api.mixins import ConditionalRecipeMixin
+from api.permissions import IsAdministrator, OwnerOrReadOnly
+from api.pagination import (
+    RecipeCursorPagination, RecipePageNumberPagination,
+    use_cursor_pagination
+)
+from api.filters import RANKED_FILTERS, RecipeFilterSet
+from foodgram.settings import (
+    INGREDIENT_SEARCH_LIMIT, SHOPPING_CART_FILENAME,
+    SHOPPING_CART_DEFAULT_FORMAT
 )
-from api.core import get_shopping_cart_txt
-from api.permissions import OwnerOrReadOnly
-from api.pagination import RecipePageNumberPagination
-from api.filters import RecipeFilterSet
-from users.models import User
-from foodgram.settings import SHOPPING_CART_FILENAME
-
-CONTENT_TYPE_SHOPPING_CART = 'text/plain; charset=UTF-8'
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalRecipeMixin, viewsets.ModelViewSet):
     filter_backends = (DjangoFilterBackend, )
     pagination_class = RecipePageNumberPagination
     filterset_class = RecipeFilterSet
     permission_classes = (IsAuthenticatedOrReadOnly, OwnerOrReadOnly)
     queryset = Recipe.objects.all()
+    query_budget = {
+        'list': 7,
+        'retrieve': 5,
+        'create': 13,
+        'update': 14,
+        'partial_update': 14,
+        'destroy': 14,
+        'pantry': 5,
+    }
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if use_cursor_pagination(self.request) and not any(
+                name in self.request.query_params for name in RANKED_FILTERS
+            ):
+                self._paginator = RecipeCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def get_queryset(self):
+        return super().get_queryset().select_related(
+            'author'
+        ).prefetch_related(
+            Prefetch(
+                'tags',
+                queryset=RecipeTag.objects.select_related('tag')
+            ),
+            Prefetch(
+                'ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        ).with_user_flags(self.request.user)
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
@@ -37,95 +88,140 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeCreateSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
 
     def perform_update(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        serializer.instance = self.get_queryset().get(pk=recipe.pk)
+
+    @action(('get',), detail=False)
+    def pantry(self, request):
+        serializer = PantrySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        paginator = self.pagination_class()
+        matches = paginator.paginate_queryset(
+            pantry_index.match(serializer.validated_data['ingredients']),
+            request, view=self
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in matches]
+        )
+        results = list()
+        for recipe_id, matched, coverage in matches:
+            if recipe_id in recipes:
+                recipe = recipes[recipe_id]
+                recipe.matched_ingredients = matched
+                recipe.coverage = round(coverage, 3)
+                results.append(recipe)
+        return paginator.get_paginated_response(RecipePantrySerializer(
+            results, many=True, context=self.get_serializer_context()
+        ).data)
 
 
 class APITag(APIView):
+    query_budget = {'get': 2}
+
     def get(self, request, tag_id=None):
-        tags = Tag.objects.all()
-        serializer = TagSerializer(tags, many=True)
         if tag_id:
-            tags = get_object_or_404(Tag, id=tag_id)
-            serializer = TagSerializer(tags)
-        return Response(serializer.data)
+            tag = get_object_or_404(Tag, id=tag_id)
+            return Response(TagSerializer(tag).data)
+        return get_catalog_response(
+            request, TAGS_CACHE_KEY,
+            lambda: TagSerializer(
+                Tag.objects.order_by('id'), many=True
+            ).data
+        )
 
 
 class APIIngredient(APIView):
+    query_budget = {'get': 2}
 
     def get(self, request, ingredient_id=None):
-        params = request.query_params
-        ingredients = Ingredient.objects.all()
-        if params:
-            ingredients = ingredients.filter(
-                name__startswith=params.get('name')
-            )
-        serializer = IngredientSerializer(ingredients, many=True)
         if ingredient_id:
-            ingredients = get_object_or_404(Ingredient, id=ingredient_id)
-            serializer = IngredientSerializer(ingredients)
-        return Response(serializer.data)
-
-
-class APIFavorite(APIView):
+            ingredient = get_object_or_404(Ingredient, id=ingredient_id)
+            return Response(IngredientSerializer(ingredient).data)
+        if 'name' in request.query_params:
+            return Response(ingredient_index.search(
+                request.query_params['name'], INGREDIENT_SEARCH_LIMIT
+            ))
+        return get_catalog_response(
+            request, INGREDIENTS_CACHE_KEY,
+            lambda: IngredientSerializer(
+                Ingredient.objects.order_by('name'), many=True
+            ).data
+        )
+
+
+class RecipeRelationView(APIView):
     permission_classes = (OwnerOrReadOnly, IsAuthenticatedOrReadOnly)
+    query_budget = {'post': 8, 'delete': 6}
+    model = None
 
-    def post(self, request, *args, **kwargs):
-        recipe = Recipe.objects.filter(id=kwargs.get('recipe_id')).first()
+    @transaction.atomic
+    def post(self, request, recipe_id=None):
+        recipe = Recipe.objects.filter(id=recipe_id).first()
         if not recipe:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        favorite = recipe.favorites.filter(user=request.user).first()
-        if favorite:
+        try:
+            with transaction.atomic():
+                self.model.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        Favorite(
-            user=request.user, recipe_id=kwargs.get('recipe_id')).save()
         serializer = RecipeSmallSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs.get('recipe_id'))
-        favorite = recipe.favorites.filter(user=request.user)
-        if not favorite.exists():
+    @transaction.atomic
+    def delete(self, request, recipe_id=None):
+        deleted, _ = self.model.objects.filter(
+            user=request.user, recipe_id=recipe_id
+        ).delete()
+        if not deleted:
+            get_object_or_404(Recipe, id=recipe_id)
             return Response(status=status.HTTP_400_BAD_REQUEST)
-        favorite.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class APIShoppingCart(APIView):
-    permission_classes = (OwnerOrReadOnly, IsAuthenticatedOrReadOnly)
+class APIFavorite(RecipeRelationView):
+    model = Favorite
+
+
+class APIShoppingCart(RecipeRelationView):
+    model = ShoppingCart
+    query_budget = {**RecipeRelationView.query_budget, 'get': 2}
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= выбирает формат списка покупок, а не рендерер DRF.
+        return super().perform_content_negotiation(request, force=True)
 
     def get(self, request, recipe_id=None):
-        user = get_object_or_404(User, username=request.user)
+        if not request.user.is_authenticated:
+            raise NotAuthenticated
+        exporter_class = SHOPPING_CART_EXPORTERS.get(
+            request.query_params.get('format', SHOPPING_CART_DEFAULT_FORMAT)
+        )
+        if exporter_class is None:
+            return Response(status=status.HTTP_400_BAD_REQUEST)
         recipes_ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_carts__user=user)
-        shopping_cart_txt = get_shopping_cart_txt(recipes_ingredients)
-        response = HttpResponse(
-            shopping_cart_txt, content_type=CONTENT_TYPE_SHOPPING_CART)
+            recipe__shopping_carts__user=request.user)
+        response = StreamingHttpResponse(
+            exporter_class(get_shopping_cart_ingredients(recipes_ingredients)),
+            content_type=exporter_class.content_type
+        )
         response['Content-Disposition'] = (
-            f'attachment; filename={SHOPPING_CART_FILENAME}')
+            'attachment; '
+            f'filename={SHOPPING_CART_FILENAME}.{exporter_class.extension}'
+        )
         return response
 
-    def post(self, request, *args, **kwargs):
-        recipe = Recipe.objects.filter(id=kwargs.get('recipe_id'))
-        if not recipe.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        recipe = recipe.first()
-        shopping_cart = recipe.shopping_carts.filter(user=request.user)
-        if shopping_cart.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        ShoppingCart(
-            user=request.user, recipe_id=kwargs.get('recipe_id')).save()
-        serializer = RecipeSmallSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete(self, request, *args, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs.get('recipe_id'))
-        if recipe is None:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        shopping_cart = recipe.shopping_carts.filter(user=request.user)
-        if not shopping_cart.exists():
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        shopping_cart.delete()
+class APIMetrics(APIView):
+    permission_classes = (IsAdministrator,)
+    query_budget = {'get': 1, 'delete': 1}
+
+    def get(self, request):
+        return Response(metrics_registry.snapshot())
+
+    def delete(self, request):
+        metrics_registry.reset()
         return Response(status=status.HTTP_204_NO_CONTENT)
@@ -3,12 +3,15 @@ from import_export.admin import ImportExportModelAdmin
 
 from django.contrib import admin
 from django.db import models
+from django.db.models import F
 from django.forms import Textarea
 
 from food.models import (
     Tag, Recipe, Ingredient, RecipeTag, RecipeIngredient, Favorite,
-    ShoppingCart
+    ShoppingCart, RecipeRank
 )
+from food.search import index_recipes
+from users.models import User
 
 
 class ViewSettings(admin.ModelAdmin):
@@ -21,6 +24,7 @@ class ViewSettings(admin.ModelAdmin):
 class IngredientResource(resources.ModelResource):
     class Meta:
         model = Ingredient
+        import_id_fields = ('name', 'measurement_unit')
 
 
 class IngredientResourceAdmin(ImportExportModelAdmin):
@@ -42,7 +46,7 @@ class IngredientInline(admin.TabularInline):
 
 class RecipeAdmin(ViewSettings):
     list_display = [field.name for field in Recipe._meta.fields]
-    list_display += ('count_in_favorite', 'ingredients')
+    list_display += ('ingredients',)
     search_fields = ('author__username', 'author__email')
     list_filter = ('tag__slug',)
     inlines = (IngredientInline,)
@@ -51,10 +55,22 @@ class RecipeAdmin(ViewSettings):
     def ingredients(self, obj):
         return ', '.join([p.ingredient.name for p in obj.ingredients.all()])
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'author' in form.changed_data:
+            for user_id, delta in ((form.initial['author'], -1),
+                                   (obj.author_id, 1)):
+                User.objects.filter(id=user_id).update(
+                    recipes_count=F('recipes_count') + delta
+                )
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        index_recipes((form.instance.id,))
+
 
 class RecipeIngredientAdmin(ViewSettings):
     list_display = [field.name for field in RecipeIngredient._meta.fields]
-    list_display += ('amount',)
     search_fields = ('recipe__name', 'ingredient__name')
     list_filter = ('recipe__tag__slug',)
     empty_value_display = '-пусто-'
@@ -67,20 +83,41 @@ class RecipeTagAdmin(ViewSettings):
     empty_value_display = '-пусто-'
 
 
-class FavoriteAdmin(ViewSettings):
+class RecipeRelationAdmin(ViewSettings):
+    counter = None
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change and 'recipe' in form.changed_data:
+            for recipe_id, delta in ((form.initial['recipe'], -1),
+                                     (obj.recipe_id, 1)):
+                Recipe.objects.filter(id=recipe_id).touch(
+                    **{self.counter: F(self.counter) + delta}
+                )
+
+
+class FavoriteAdmin(RecipeRelationAdmin):
+    counter = 'favorites_count'
     list_display = [field.name for field in Favorite._meta.fields]
     search_fields = ('user__username', 'user__email')
     list_filter = ('recipe__tag__slug',)
     empty_value_display = '-пусто-'
 
 
-class ShoppingCartAdmin(ViewSettings):
+class ShoppingCartAdmin(RecipeRelationAdmin):
+    counter = 'in_carts_count'
     list_display = [field.name for field in ShoppingCart._meta.fields]
     search_fields = ('user__username', 'user__email')
     list_filter = ('recipe__tag__slug',)
     empty_value_display = '-пусто-'
 
 
+class RecipeRankAdmin(ViewSettings):
+    list_display = [field.name for field in RecipeRank._meta.fields]
+    search_fields = ('recipe__name',)
+    empty_value_display = '-пусто-'
+
+
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(Ingredient, IngredientResourceAdmin)
@@ -88,3 +125,4 @@ admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
 admin.site.register(RecipeTag, RecipeTagAdmin)
 admin.site.register(Favorite, FavoriteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
+admin.site.register(RecipeRank, RecipeRankAdmin)
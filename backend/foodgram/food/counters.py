@@ -0,0 +1,24 @@
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), Value(0))
+
+
+def rebuild_counters(recipe_model, favorite_model, shopping_cart_model,
+                     user_model):
+    recipes = recipe_model.objects.update(
+        favorites_count=count_subquery(favorite_model, 'recipe'),
+        in_carts_count=count_subquery(shopping_cart_model, 'recipe'),
+    )
+    users = user_model.objects.update(
+        recipes_count=count_subquery(recipe_model, 'author'),
+    )
+    return recipes, users
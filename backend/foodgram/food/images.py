@@ -0,0 +1,128 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from food.models import Recipe
+from foodgram.settings import (
+    RECIPE_IMAGE_JPEG_QUALITY, RECIPE_IMAGE_VARIANTS,
+    RECIPE_IMAGE_VARIANTS_DIR, RECIPE_IMAGE_WEBP_QUALITY,
+    RECIPE_IMAGE_WORKERS
+)
+
+logger = logging.getLogger('foodgram.images')
+
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': RECIPE_IMAGE_WEBP_QUALITY, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': RECIPE_IMAGE_JPEG_QUALITY,
+                      'optimize': True, 'progressive': True}),
+}
+
+IMAGE_EXTENSIONS = {
+    'JPEG': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+IMAGE_HEADER_SIZE = 12
+
+executor = None
+executor_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(
+                max_workers=RECIPE_IMAGE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return executor
+
+
+def detect_image_format(header):
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'JPEG'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'PNG'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'GIF'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    return None
+
+
+def render_variant(image, size, image_format, options):
+    variant = ImageOps.contain(image, size, Image.LANCZOS)
+    if image_format == 'JPEG' and variant.mode != 'RGB':
+        variant = variant.convert('RGB')
+    buffer = BytesIO()
+    variant.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_image_variants(field_file):
+    storage = field_file.storage
+    stem = PurePosixPath(field_file.name).stem
+    variants = {}
+    with field_file.open('rb') as file, Image.open(file) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert(
+                'RGBA' if 'transparency' in image.info else 'RGB'
+            )
+        for name, size in RECIPE_IMAGE_VARIANTS.items():
+            variants[name] = {
+                extension: storage.save(
+                    f'{RECIPE_IMAGE_VARIANTS_DIR}/{stem}_{name}.{extension}',
+                    ContentFile(render_variant(
+                        image, size, image_format, options
+                    ))
+                )
+                for extension, (image_format, options)
+                in VARIANT_FORMATS.items()
+            }
+    return variants
+
+
+def generate_image_variants(recipe_id):
+    recipe = Recipe.objects.filter(id=recipe_id).only('id', 'image').first()
+    if recipe is None or not recipe.image:
+        return None
+    variants = build_image_variants(recipe.image)
+    Recipe.objects.filter(id=recipe.id, image=recipe.image.name).touch(
+        image_variants=variants
+    )
+    return variants
+
+
+def process_image(recipe_id):
+    try:
+        generate_image_variants(recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось подготовить изображения рецепта %s', recipe_id
+        )
+
+
+def run_image_job(recipe_id):
+    close_old_connections()
+    try:
+        process_image(recipe_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_image_variants(recipe_id):
+    if RECIPE_IMAGE_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_image_job, recipe_id)
+        )
+    else:
+        transaction.on_commit(lambda: process_image(recipe_id))
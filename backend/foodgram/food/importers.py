@@ -0,0 +1,98 @@
+import csv
+import json
+import re
+from itertools import islice
+
+from django.db import connection, transaction
+
+from food.models import Ingredient
+
+CHUNK_SIZE = 64 * 1024
+BATCH_SIZE = 5000
+CSV_HEADER = ('name', 'measurement_unit')
+SEPARATOR = re.compile(r'[\s,]*')
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) < 2 or tuple(row[:2]) == CSV_HEADER:
+            continue
+        yield row[0], row[1]
+
+
+def iter_json_array(file, chunk_size=CHUNK_SIZE):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    chunk = True
+    while not buffer and chunk:
+        chunk = file.read(chunk_size)
+        buffer = chunk.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('Ожидается JSON-массив.')
+    position = 1
+    eof = False
+    while True:
+        position = SEPARATOR.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = None
+        # Число в конце буфера могло быть разрезано границей чанка.
+        if end is None or (end == len(buffer) and not eof):
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        position = end
+        yield item
+
+
+def read_json(file):
+    for item in iter_json_array(file):
+        yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+}
+
+
+def insert_ingredients(cursor, rows):
+    quote_name = connection.ops.quote_name
+    cursor.execute(
+        f'INSERT INTO {quote_name(Ingredient._meta.db_table)} '
+        f'({quote_name("name")}, {quote_name("measurement_unit")}) '
+        f'VALUES {", ".join(["(%s, %s)"] * len(rows))} '
+        'ON CONFLICT DO NOTHING',
+        [value for row in rows for value in row]
+    )
+
+
+def load_ingredients(rows, batch_size=BATCH_SIZE):
+    rows = iter(rows)
+    batch_size = min(batch_size, connection.ops.bulk_batch_size(
+        ('name', 'measurement_unit'), range(batch_size)
+    ))
+    read = 0
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return read
+            read += len(batch)
+            unique = [
+                (name, unit)
+                for name, unit in dict.fromkeys(
+                    (name.strip(), unit.strip()) for name, unit in batch
+                )
+                if name and unit
+            ]
+            if unique:
+                with transaction.atomic():
+                    insert_ingredients(cursor, unique)
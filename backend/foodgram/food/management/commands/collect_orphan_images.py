@@ -0,0 +1,69 @@
+import posixpath
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from food.models import Recipe
+from food.storage import image_storage
+
+IMAGES_DIR = 'recipe/images'
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = 'Удаляет файлы изображений, на которые не ссылается ни один рецепт'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено'
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=60 * 60,
+            help='Не трогать файлы моложе указанного числа секунд'
+        )
+
+    def handle(self, *args, **options):
+        referenced = set()
+        for image, variants in Recipe.objects.values_list(
+                'image', 'image_variants').iterator():
+            referenced.add(image)
+            for formats in variants.values():
+                referenced.update(formats.values())
+        if not image_storage.exists(IMAGES_DIR):
+            self.stdout.write('Каталог изображений пуст.')
+            return
+        created_before = timezone.now() - timedelta(
+            seconds=options['min_age']
+        )
+        removed = 0
+        freed = 0
+        for name in walk(image_storage, IMAGES_DIR):
+            if name in referenced:
+                continue
+            # Рецепт мог получить файл после того, как собрали referenced.
+            if Recipe.objects.filter(image=name).exists():
+                continue
+            if image_storage.get_modified_time(name) > created_before:
+                continue
+            freed += image_storage.size(name)
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(name)
+            else:
+                image_storage.delete(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {freed / 1024 / 1024:.1f} МБ'
+        ))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from food.images import process_image
+from food.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Готовит уменьшенные копии изображений рецептов, '
+            'для которых их ещё нет')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Пересоздать копии для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.all()
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        recipe_ids = list(recipes.values_list('id', flat=True))
+        for recipe_id in recipe_ids:
+            process_image(recipe_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано рецептов: {len(recipe_ids)}'
+        ))
@@ -0,0 +1,43 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import INGREDIENTS_CACHE_KEY, invalidate_catalog
+from food.importers import BATCH_SIZE, READERS, load_ingredients
+from food.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV или JSON потоково, '
+            'пропуская уже существующие')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к файлу с ингредиентами')
+        parser.add_argument(
+            '--format', choices=tuple(READERS),
+            help='Формат файла; по умолчанию определяется по расширению'
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path.name}')
+        before = Ingredient.objects.count()
+        started = time.perf_counter()
+        try:
+            with open(path, encoding='utf-8', newline='') as file:
+                read = load_ingredients(
+                    READERS[file_format](file), options['batch_size']
+                )
+        except (OSError, ValueError, KeyError) as error:
+            raise CommandError(f'Не удалось загрузить ингредиенты: {error}')
+        elapsed = time.perf_counter() - started
+        created = Ingredient.objects.count() - before
+        invalidate_catalog(INGREDIENTS_CACHE_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {read}, добавлено: {created}, '
+            f'{read / elapsed if elapsed else read:.0f} строк/с'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from food.counters import rebuild_counters
+from food.models import Favorite, Recipe, ShoppingCart
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики избранного, списков покупок '
+            'и рецептов авторов')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        recipes, users = rebuild_counters(
+            Recipe, Favorite, ShoppingCart, User
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рецептов: {recipes}, пользователей: {users}'
+        ))
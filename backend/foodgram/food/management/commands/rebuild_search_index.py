@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from food.search import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковые документы всех рецептов'
+
+    def handle(self, *args, **options):
+        indexed = index_recipes()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {indexed}'
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from food.ranking import update_rankings
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинги рецептов, изменившихся '
+            'с прошлого запуска')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать рейтинги всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        ranked = update_rankings(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано рейтингов: {ranked}'
+        ))
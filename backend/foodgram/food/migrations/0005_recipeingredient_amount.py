@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0004_alter_ingredient_amount_alter_recipe_cooking_time'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipeingredient',
+            name='amount',
+            field=models.PositiveSmallIntegerField(help_text='Количество ингредиента в рецепте', null=True, verbose_name='Количество'),
+        ),
+    ]
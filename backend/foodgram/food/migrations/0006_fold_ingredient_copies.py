@@ -0,0 +1,52 @@
+from django.db import migrations
+from django.db.models import F
+
+DEFAULT_AMOUNT = 1
+
+
+def fold_ingredient_copies(apps, schema_editor):
+    Ingredient = apps.get_model('food', 'Ingredient')
+    RecipeIngredient = apps.get_model('food', 'RecipeIngredient')
+
+    canonical = {}
+    for ingredient in Ingredient.objects.order_by(
+            F('amount').asc(nulls_first=True), 'id'):
+        canonical.setdefault(
+            (ingredient.name, ingredient.measurement_unit), ingredient.id
+        )
+
+    links = {}
+    duplicates = []
+    for link in RecipeIngredient.objects.select_related(
+            'ingredient').order_by('id'):
+        ingredient_id = canonical[
+            (link.ingredient.name, link.ingredient.measurement_unit)
+        ]
+        amount = link.ingredient.amount or DEFAULT_AMOUNT
+        folded = links.get((link.recipe_id, ingredient_id))
+        if folded is not None:
+            folded.amount += amount
+            duplicates.append(link.id)
+            continue
+        link.ingredient_id = ingredient_id
+        link.amount = amount
+        links[(link.recipe_id, ingredient_id)] = link
+
+    RecipeIngredient.objects.filter(id__in=duplicates).delete()
+    RecipeIngredient.objects.bulk_update(
+        links.values(), ('ingredient', 'amount'), batch_size=1000
+    )
+    Ingredient.objects.exclude(id__in=canonical.values()).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0005_recipeingredient_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fold_ingredient_copies, migrations.RunPython.noop
+        ),
+    ]
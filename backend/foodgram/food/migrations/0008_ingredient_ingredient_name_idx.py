@@ -0,0 +1,17 @@
+# Generated by Django 4.2.5 on 2026-10-18 17:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0007_remove_ingredient_amount_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_idx', opclasses=('varchar_pattern_ops',)),
+        ),
+    ]
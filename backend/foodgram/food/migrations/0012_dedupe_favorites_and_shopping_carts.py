@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), Value(0))
+
+
+def dedupe(apps, schema_editor):
+    for model_name in ('Favorite', 'ShoppingCart'):
+        model = apps.get_model('food', model_name)
+        kept = model.objects.values('user', 'recipe').annotate(
+            kept_id=Min('id')
+        ).values('kept_id')
+        model.objects.exclude(id__in=kept).delete()
+    apps.get_model('food', 'Recipe').objects.update(
+        favorites_count=count_subquery(
+            apps.get_model('food', 'Favorite'), 'recipe'
+        ),
+        in_carts_count=count_subquery(
+            apps.get_model('food', 'ShoppingCart'), 'recipe'
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0011_recipe_ranking'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe, migrations.RunPython.noop),
+    ]
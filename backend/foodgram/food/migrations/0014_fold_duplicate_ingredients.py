@@ -0,0 +1,55 @@
+from django.db import migrations
+
+
+def fold_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('food', 'Ingredient')
+    RecipeIngredient = apps.get_model('food', 'RecipeIngredient')
+
+    canonical = {}
+    clones = {}
+    for ingredient in Ingredient.objects.order_by('id'):
+        key = (ingredient.name, ingredient.measurement_unit)
+        if key in canonical:
+            clones[ingredient.id] = canonical[key]
+        else:
+            canonical[key] = ingredient.id
+    if not clones:
+        return
+
+    links = {
+        (link.recipe_id, link.ingredient_id): link
+        for link in RecipeIngredient.objects.filter(
+            ingredient_id__in=set(clones.values())
+        )
+    }
+    duplicates = []
+    for link in RecipeIngredient.objects.filter(
+            ingredient_id__in=clones).order_by('id'):
+        ingredient_id = clones[link.ingredient_id]
+        folded = links.get((link.recipe_id, ingredient_id))
+        if folded is not None:
+            # Сумма не должна выйти за PositiveSmallIntegerField.
+            folded.amount = min(folded.amount + link.amount, 32767)
+            duplicates.append(link.id)
+            continue
+        link.ingredient_id = ingredient_id
+        links[(link.recipe_id, ingredient_id)] = link
+
+    RecipeIngredient.objects.filter(id__in=duplicates).delete()
+    RecipeIngredient.objects.bulk_update(
+        links.values(), ('ingredient', 'amount'), batch_size=1000
+    )
+    Ingredient.objects.filter(id__in=clones).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0013_favorite_shoppingcart_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            fold_duplicate_ingredients, migrations.RunPython.noop
+        ),
+    ]
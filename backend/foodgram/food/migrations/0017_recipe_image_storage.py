@@ -0,0 +1,17 @@
+from django.db import migrations, models
+import food.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0016_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(help_text='Изображение рецепта', storage=food.storage.get_image_storage, upload_to='recipe/images/', verbose_name='Изображение'),
+        ),
+    ]
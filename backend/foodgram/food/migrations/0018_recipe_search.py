@@ -0,0 +1,123 @@
+# Generated by Django 4.2.5 on 2026-10-18 17:37
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+SEARCH_CONFIG = 'russian'
+SEARCH_INDEX_NAME = 'recipe_search_idx'
+BATCH_SIZE = 1000
+FTS_CREATE = (
+    "CREATE VIRTUAL TABLE food_recipe_fts USING fts5("
+    "name, keywords, text, content='food_recipesearchdocument', "
+    "content_rowid='recipe_id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER food_recipe_fts_insert "
+    "AFTER INSERT ON food_recipesearchdocument BEGIN "
+    "INSERT INTO food_recipe_fts(rowid, name, keywords, text) "
+    "VALUES (new.recipe_id, new.name, new.keywords, new.text); END",
+    "CREATE TRIGGER food_recipe_fts_delete "
+    "AFTER DELETE ON food_recipesearchdocument BEGIN "
+    "INSERT INTO food_recipe_fts(food_recipe_fts, rowid, name, keywords, "
+    "text) VALUES ('delete', old.recipe_id, old.name, old.keywords, "
+    "old.text); END",
+    "CREATE TRIGGER food_recipe_fts_update "
+    "AFTER UPDATE ON food_recipesearchdocument BEGIN "
+    "INSERT INTO food_recipe_fts(food_recipe_fts, rowid, name, keywords, "
+    "text) VALUES ('delete', old.recipe_id, old.name, old.keywords, "
+    "old.text); "
+    "INSERT INTO food_recipe_fts(rowid, name, keywords, text) "
+    "VALUES (new.recipe_id, new.name, new.keywords, new.text); END",
+)
+FTS_DROP = (
+    'DROP TRIGGER IF EXISTS food_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS food_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS food_recipe_fts_update',
+    'DROP TABLE IF EXISTS food_recipe_fts',
+)
+
+
+def get_search_index():
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('keywords', weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG),
+        name=SEARCH_INDEX_NAME
+    )
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.add_index(
+            apps.get_model('food', 'RecipeSearchDocument'),
+            get_search_index()
+        )
+    elif vendor == 'sqlite':
+        for statement in FTS_CREATE:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.remove_index(
+            apps.get_model('food', 'RecipeSearchDocument'),
+            get_search_index()
+        )
+    elif vendor == 'sqlite':
+        for statement in FTS_DROP:
+            schema_editor.execute(statement)
+
+
+def index_recipes(apps, schema_editor):
+    Recipe = apps.get_model('food', 'Recipe')
+    RecipeSearchDocument = apps.get_model('food', 'RecipeSearchDocument')
+    recipe_ids = list(
+        Recipe.objects.order_by('id').values_list('id', flat=True)
+    )
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        recipes = Recipe.objects.filter(
+            id__in=recipe_ids[start:start + BATCH_SIZE]
+        ).order_by()
+        keywords = defaultdict(list)
+        for lookup in ('tags__tag__name', 'ingredients__ingredient__name'):
+            for recipe_id, keyword in recipes.filter(
+                **{f'{lookup}__isnull': False}
+            ).values_list('id', lookup):
+                keywords[recipe_id].append(keyword)
+        RecipeSearchDocument.objects.bulk_create(
+            RecipeSearchDocument(
+                recipe_id=id, name=name, keywords=', '.join(keywords[id]),
+                text=text
+            )
+            for id, name, text in recipes.values_list('id', 'name', 'text')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0017_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSearchDocument',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='food.recipe', verbose_name='Рецепт')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+                ('keywords', models.TextField(blank=True, verbose_name='Тэги и ингредиенты')),
+                ('text', models.TextField(blank=True, verbose_name='Описание')),
+            ],
+            options={
+                'verbose_name': 'поисковый документ рецепта',
+                'verbose_name_plural': 'Поисковые документы рецептов',
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(index_recipes, migrations.RunPython.noop),
+    ]
@@ -2,8 +2,10 @@ from colorfield.fields import ColorField
 
 from django.db import models
 from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
 
-from users.models import User
+from food.storage import get_image_storage
+from users.models import Subscription, User
 from foodgram.settings import (
     MIN_COOKING_TIME, MAX_COOKING_TIME,
     MIN_INGREDIENTS_AMOUNT, MAX_INGREDIENTS_AMOUNT
@@ -41,6 +43,30 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    def touch(self, **counters):
+        return self.update(updated_at=timezone.now(), **counters)
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(False),
+                is_in_shopping_cart=models.Value(False),
+                is_author_subscribed=models.Value(False),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                recipe=models.OuterRef('pk'), user=user
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                recipe=models.OuterRef('pk'), user=user
+            )),
+            is_author_subscribed=models.Exists(Subscription.objects.filter(
+                user=models.OuterRef('author'), subscriber=user
+            )),
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -59,9 +85,16 @@ class Recipe(models.Model):
         'Изображение',
         help_text='Изображение рецепта',
         upload_to='recipe/images/',
+        storage=get_image_storage,
         blank=False,
         null=False
     )
+    image_variants = models.JSONField(
+        'Варианты изображения',
+        help_text='Уменьшенные копии изображения в разных форматах',
+        default=dict,
+        blank=True
+    )
     name = models.CharField(
         'Название',
         max_length=200,
@@ -93,6 +126,23 @@ class Recipe(models.Model):
         auto_now_add=True,
         db_index=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        help_text='Дата последнего изменения рецепта или его связей',
+        auto_now=True
+    )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном',
+        help_text='Сколько раз рецепт добавлен в избранное',
+        default=0
+    )
+    in_carts_count = models.PositiveIntegerField(
+        'В списках покупок',
+        help_text='Сколько раз рецепт добавлен в список покупок',
+        default=0
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
@@ -102,9 +152,6 @@ class Recipe(models.Model):
     def __str__(self):
         return self.name
 
-    def count_in_favorite(self):
-        return self.favorites.count()
-
 
 class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
@@ -120,6 +167,14 @@ class RecipeIngredient(models.Model):
         on_delete=models.CASCADE,
         related_name='recipes',
     )
+    amount = models.PositiveSmallIntegerField(
+        'Количество',
+        help_text='Количество ингредиента в рецепте',
+        validators=(
+            MaxValueValidator(MAX_INGREDIENTS_AMOUNT),
+            MinValueValidator(MIN_INGREDIENTS_AMOUNT)
+        )
+    )
 
     class Meta:
         verbose_name = 'рецепт ингредиент'
@@ -131,9 +186,6 @@ class RecipeIngredient(models.Model):
             ),
         )
 
-    def amount(self):
-        return self.ingredient.amount
-
 
 class RecipeTag(models.Model):
     recipe = models.ForeignKey(
@@ -173,19 +225,23 @@ class Ingredient(models.Model):
         max_length=200,
         help_text='Единица измерения ингредиента'
     )
-    amount = models.PositiveSmallIntegerField(
-        'Количество',
-        help_text='Количество ингредиентов',
-        null=True,
-        validators=(
-            MaxValueValidator(MAX_INGREDIENTS_AMOUNT),
-            MinValueValidator(MIN_INGREDIENTS_AMOUNT)
-        )
-    )
 
     class Meta:
         verbose_name = 'ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('name',),
+                name='ingredient_name_idx',
+                opclasses=('varchar_pattern_ops',)
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -203,10 +259,21 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         related_name='favorites'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'избранное'
         verbose_name_plural = 'Избранное'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_favorite'
+            ),
+        )
 
 
 class ShoppingCart(models.Model):
@@ -222,7 +289,86 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         related_name='shopping_carts'
     )
+    created = models.DateTimeField(
+        'Дата добавления',
+        auto_now_add=True,
+        db_index=True
+    )
 
     class Meta:
         verbose_name = 'список покупок'
         verbose_name_plural = 'Покупки'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_shopping_cart'
+            ),
+        )
+
+
+class RecipeRank(models.Model):
+    recipe = models.OneToOneField(
+        'Recipe',
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rank'
+    )
+    favorites_recent = models.PositiveIntegerField(
+        'Избранное за период',
+        default=0
+    )
+    carts_recent = models.PositiveIntegerField(
+        'Списки покупок за период',
+        default=0
+    )
+    popular = models.FloatField(
+        'Популярность',
+        default=0,
+        db_index=True
+    )
+    trending = models.FloatField(
+        'Тренд',
+        default=0,
+        db_index=True
+    )
+    computed_at = models.DateTimeField(
+        'Дата расчёта',
+        db_index=True
+    )
+
+    class Meta:
+        verbose_name = 'рейтинг рецепта'
+        verbose_name_plural = 'Рейтинги рецептов'
+
+    def __str__(self):
+        return str(self.recipe_id)
+
+
+class RecipeSearchDocument(models.Model):
+    recipe = models.OneToOneField(
+        'Recipe',
+        verbose_name='Рецепт',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document'
+    )
+    name = models.CharField(
+        'Название',
+        max_length=200
+    )
+    keywords = models.TextField(
+        'Тэги и ингредиенты',
+        blank=True
+    )
+    text = models.TextField(
+        'Описание',
+        blank=True
+    )
+
+    class Meta:
+        verbose_name = 'поисковый документ рецепта'
+        verbose_name_plural = 'Поисковые документы рецептов'
+
+    def __str__(self):
+        return str(self.recipe_id)
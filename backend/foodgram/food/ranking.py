@@ -0,0 +1,99 @@
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from food.models import Recipe, RecipeRank
+from foodgram.settings import (
+    RANKING_BATCH_SIZE, RANKING_CART_WEIGHT, RANKING_RECENT_DAYS,
+    RANKING_TRENDING_GRAVITY
+)
+
+RANKING_ORDERINGS = {
+    'popular': 'rank__popular',
+    'trending': 'rank__trending',
+}
+
+
+def get_popular_score(favorites, carts):
+    return favorites + RANKING_CART_WEIGHT * carts
+
+
+def get_trending_score(favorites, carts, pub_date):
+    activity = get_popular_score(favorites, carts)
+    return (
+        math.log10(1 + activity)
+        + pub_date.timestamp() / RANKING_TRENDING_GRAVITY
+    )
+
+
+def get_stale_recipe_ids(since):
+    recipes = Recipe.objects.all()
+    if since is not None:
+        recipes = recipes.filter(
+            Q(updated_at__gte=since)
+            | Q(rank__isnull=True)
+            | Q(rank__favorites_recent__gt=0)
+            | Q(rank__carts_recent__gt=0)
+        )
+    return recipes.order_by('id').values_list('id', flat=True)
+
+
+def rank_recipes(recipe_ids, recent_since, computed_at):
+    recipes = Recipe.objects.filter(id__in=recipe_ids).annotate(
+        favorites_recent=Count(
+            'favorites',
+            filter=Q(favorites__created__gte=recent_since),
+            distinct=True
+        ),
+        carts_recent=Count(
+            'shopping_carts',
+            filter=Q(shopping_carts__created__gte=recent_since),
+            distinct=True
+        ),
+    ).values_list(
+        'id', 'pub_date', 'favorites_count', 'in_carts_count',
+        'favorites_recent', 'carts_recent'
+    ).order_by()
+    return RecipeRank.objects.bulk_create(
+        (
+            RecipeRank(
+                recipe_id=id,
+                favorites_recent=favorites_recent,
+                carts_recent=carts_recent,
+                popular=get_popular_score(favorites_count, in_carts_count),
+                trending=get_trending_score(
+                    favorites_recent, carts_recent, pub_date
+                ),
+                computed_at=computed_at,
+            )
+            for (id, pub_date, favorites_count, in_carts_count,
+                 favorites_recent, carts_recent) in recipes
+        ),
+        update_conflicts=True,
+        unique_fields=('recipe',),
+        update_fields=(
+            'favorites_recent', 'carts_recent', 'popular', 'trending',
+            'computed_at'
+        ),
+    )
+
+
+def update_rankings(full=False):
+    computed_at = timezone.now()
+    recent_since = computed_at - timedelta(days=RANKING_RECENT_DAYS)
+    since = None
+    if not full:
+        since = RecipeRank.objects.aggregate(
+            since=Max('computed_at')
+        )['since']
+    recipe_ids = list(get_stale_recipe_ids(since))
+    for start in range(0, len(recipe_ids), RANKING_BATCH_SIZE):
+        with transaction.atomic():
+            rank_recipes(
+                recipe_ids[start:start + RANKING_BATCH_SIZE],
+                recent_since, computed_at
+            )
+    return len(recipe_ids)
@@ -0,0 +1,122 @@
+import operator
+import re
+from collections import defaultdict
+from functools import reduce
+
+from django.db import connections, transaction
+from django.db.models import Value
+
+from food.models import Recipe, RecipeSearchDocument
+from foodgram.settings import RECIPE_SEARCH_BATCH_SIZE, RECIPE_SEARCH_CONFIG
+
+SEARCH_FIELDS = ('name', 'keywords', 'text')
+SEARCH_WEIGHTS = ('A', 'B', 'C')
+KEYWORD_LOOKUPS = ('tags__tag__name', 'ingredients__ingredient__name')
+TOKEN = re.compile(r'\w+')
+
+FTS_TABLE = 'food_recipe_fts'
+FTS_WEIGHTS = (10.0, 4.0, 1.0)
+
+
+def get_search_vector(prefix=''):
+    from django.contrib.postgres.search import SearchVector
+
+    return reduce(operator.add, (
+        SearchVector(
+            prefix + field, weight=weight, config=RECIPE_SEARCH_CONFIG
+        )
+        for field, weight in zip(SEARCH_FIELDS, SEARCH_WEIGHTS)
+    ))
+
+
+def build_documents(recipe_ids):
+    recipes = Recipe.objects.filter(id__in=recipe_ids).order_by()
+    keywords = defaultdict(list)
+    for lookup in KEYWORD_LOOKUPS:
+        for recipe_id, keyword in recipes.filter(
+            **{f'{lookup}__isnull': False}
+        ).values_list('id', lookup):
+            keywords[recipe_id].append(keyword)
+    return [
+        RecipeSearchDocument(
+            recipe_id=id, name=name, keywords=', '.join(keywords[id]),
+            text=text
+        )
+        for id, name, text in recipes.values_list('id', 'name', 'text')
+    ]
+
+
+def save_documents(documents):
+    return RecipeSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=('recipe',),
+        update_fields=('name', 'keywords', 'text'),
+    )
+
+
+def index_recipes(recipe_ids=None):
+    if recipe_ids is None:
+        recipe_ids = Recipe.objects.order_by('id').values_list(
+            'id', flat=True
+        )
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), RECIPE_SEARCH_BATCH_SIZE):
+        with transaction.atomic():
+            save_documents(build_documents(
+                recipe_ids[start:start + RECIPE_SEARCH_BATCH_SIZE]
+            ))
+    return len(recipe_ids)
+
+
+def index_recipe(recipe, related):
+    return save_documents((
+        RecipeSearchDocument(
+            recipe=recipe,
+            name=recipe.name,
+            keywords=', '.join(item.name for item in related),
+            text=recipe.text,
+        ),
+    ))
+
+
+def search_postgresql(queryset, query):
+    from django.contrib.postgres.search import SearchQuery, SearchRank
+
+    search_query = SearchQuery(
+        query, config=RECIPE_SEARCH_CONFIG, search_type='websearch'
+    )
+    vector = get_search_vector('search_document__')
+    return queryset.alias(search_vector=vector).filter(
+        search_vector=search_query
+    ).annotate(search_rank=SearchRank(vector, search_query))
+
+
+def search_sqlite(queryset, query):
+    tokens = TOKEN.findall(query)
+    if not tokens:
+        return queryset.annotate(search_rank=Value(0.0)).none()
+    # FTS5 ищет только через MATCH по самой виртуальной таблице, а bm25()
+    # работает лишь в запросе, где эта таблица стоит во FROM. Подзапрос
+    # в RawSQL или Exists теряет ранг, а модели для food_recipe_fts, через
+    # которую можно было бы сделать JOIN, нет. Поэтому extra().
+    return queryset.extra(
+        select={'search_rank': f'-bm25({FTS_TABLE}, %s, %s, %s)'},
+        select_params=FTS_WEIGHTS,
+        tables=(FTS_TABLE,),
+        where=(
+            f'{FTS_TABLE}.rowid = {Recipe._meta.db_table}.id',
+            f'{FTS_TABLE} MATCH %s',
+        ),
+        params=(' '.join(f'"{token}"*' for token in tokens),),
+    )
+
+
+SEARCH_BACKENDS = {
+    'postgresql': search_postgresql,
+    'sqlite': search_sqlite,
+}
+
+
+def search_recipes(queryset, query):
+    return SEARCH_BACKENDS[connections[queryset.db].vendor](queryset, query)
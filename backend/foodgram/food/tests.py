@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from food.importers import CHUNK_SIZE, iter_json_array
+from food.models import Ingredient
+from food.storage import image_storage
+
+
+class OrphanImageTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def save_old_image(self):
+        name = image_storage.save(
+            'recipe/images/image.png', ContentFile(b'image')
+        )
+        past = time.time() - 2 * 60 * 60
+        os.utime(image_storage.path(name), (past, past))
+        return name
+
+    def test_collector_removes_old_orphans(self):
+        name = self.save_old_image()
+        call_command('collect_orphan_images', stdout=StringIO())
+        self.assertFalse(image_storage.exists(name))
+
+    def test_reused_image_is_not_collected(self):
+        name = self.save_old_image()
+        self.assertEqual(image_storage.save(
+            'recipe/images/other.png', ContentFile(b'image')
+        ), name)
+        call_command('collect_orphan_images', stdout=StringIO())
+        self.assertTrue(image_storage.exists(name))
+
+
+class IngredientImportTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path):
+        stdout = StringIO()
+        call_command('load_ingredients', path, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_csv(self):
+        path = self.write('ingredients.csv', (
+            'name,measurement_unit\n'
+            'соль,г\n'
+            ' соль , г \n'
+            '"мука, пшеничная",г\n'
+            'яйца,шт\n'
+            '\n'
+            ',г\n'
+        ))
+        self.assertIn('добавлено: 3', self.load(path))
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {('соль', 'г'), ('мука, пшеничная', 'г'), ('яйца', 'шт')}
+        )
+        self.assertIn('добавлено: 0', self.load(path))
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_json_split_across_chunks(self):
+        items = [
+            {'name': f'Ингредиент [{number}], "сорт"',
+             'measurement_unit': 'г'}
+            for number in range(3000)
+        ]
+        content = json.dumps(items + items[:10], ensure_ascii=False, indent=1)
+        self.assertGreater(len(content), 2 * CHUNK_SIZE)
+        path = self.write('ingredients.json', content)
+        self.assertIn('добавлено: 3000', self.load(path))
+        self.assertIn('добавлено: 0', self.load(path))
+        self.assertEqual(Ingredient.objects.count(), 3000)
+
+    def test_iter_json_array_with_small_chunks(self):
+        items = [{'name': 'a ] , [', 'measurement_unit': 'г'}, 12345, [2, 3]]
+        for chunk_size in (1, 3, 7):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(list(iter_json_array(
+                    StringIO(f'  {json.dumps(items, indent=2)}  '),
+                    chunk_size
+                )), items)
+        with self.assertRaises(ValueError):
+            list(iter_json_array(StringIO('{"name": "соль"}'), 3))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(StringIO('[{"name": '), 3))
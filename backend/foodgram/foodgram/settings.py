@@ -69,6 +69,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'api.middleware.RequestMetricsMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
@@ -98,6 +99,18 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+
+REQUEST_METRICS = os.getenv('REQUEST_METRICS', 'False') == 'True'
+REQUEST_METRICS_LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+REQUEST_METRICS_QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -132,4 +145,28 @@ MAX_INGREDIENTS_AMOUNT = 32767
 MIN_INGREDIENTS_AMOUNT = 1
 MIN_COOKING_TIME = 1
 MAX_COOKING_TIME = 32767
-SHOPPING_CART_FILENAME = 'shopping_cart.txt'
+SHOPPING_CART_FILENAME = 'shopping_cart'
+SHOPPING_CART_DEFAULT_FORMAT = 'txt'
+SHOPPING_CART_PDF_FONT = BASE_DIR / 'api' / 'fonts' / 'DejaVuSans.ttf'
+SHOPPING_CART_PDF_FONT_SIZE = 12
+INGREDIENT_SEARCH_LIMIT = 20
+RANKING_RECENT_DAYS = 7
+RANKING_CART_WEIGHT = 0.5
+RANKING_TRENDING_GRAVITY = 60 * 60 * 24 * 2
+RANKING_BATCH_SIZE = 1000
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+RECIPE_IMAGE_MAX_PIXELS = 4096 * 4096
+RECIPE_IMAGE_SPOOL_SIZE = 1024 * 1024
+RECIPE_IMAGE_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+RECIPE_IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'card': (640, 640),
+}
+RECIPE_IMAGE_VARIANTS_DIR = 'recipe/images/variants'
+RECIPE_IMAGE_WEBP_QUALITY = 80
+RECIPE_IMAGE_JPEG_QUALITY = 85
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', 2))
+RECIPE_SEARCH_CONFIG = 'russian'
+RECIPE_SEARCH_BATCH_SIZE = 1000
+PANTRY_MAX_INGREDIENTS = 50
+PANTRY_MAX_CHANGES = 1000
@@ -15,7 +15,7 @@ class ViewSettings(admin.ModelAdmin):
 class UserAdmin(ViewSettings):
     list_display = ['id', 'username', 'first_name',
                     'last_name', 'email', 'is_staff', 'is_active',
-                    'last_login', 'date_joined', 'role']
+                    'last_login', 'date_joined', 'role', 'recipes_count']
     empty_value_display = '-пусто-'
     list_filter = ('is_staff', 'is_active')
     search_fields = ('username', 'email')
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import UserManager as BaseUserManager
 from django.db import models
 
 ADMINISTRATOR = 'administrator'
@@ -36,6 +37,21 @@ class Subscription(models.Model):
         )
 
 
+class UserQuerySet(models.QuerySet):
+    def with_subscription_flag(self, user):
+        if not user.is_authenticated:
+            return self.annotate(is_subscribed=models.Value(False))
+        return self.annotate(
+            is_subscribed=models.Exists(Subscription.objects.filter(
+                user=models.OuterRef('pk'), subscriber=user
+            ))
+        )
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     email = models.EmailField(
         'Адрес эл.почты',
@@ -51,6 +67,12 @@ class User(AbstractUser):
     )
     first_name = models.CharField("Имя", max_length=150, blank=False)
     last_name = models.CharField("Фамилия", max_length=150, blank=False)
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов',
+        default=0
+    )
+
+    objects = UserManager()
 
     class Meta:
         verbose_name = 'Пользователь'
@@ -23,6 +23,8 @@ class UserSerializer(UserCreateSerializer):
                   )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if self.context.get('request').user.id is None:
             return False
         return Subscription.objects.filter(
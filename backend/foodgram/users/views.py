@@ -5,8 +5,12 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from djoser.views import UserViewSet
+from djoser import views as djoser_views
 
+from api.core import prefetch_recent_recipes
+from api.pagination import (
+    SubscriptionCursorPagination, use_cursor_pagination
+)
 from api.serializers import SubscribeSerializer
 from api.permissions import OwnerOrReadOnly
 from users.models import Subscription, User
@@ -14,19 +18,23 @@ from users.models import Subscription, User
 
 class APISubscription(APIView, LimitOffsetPagination):
     permission_classes = (OwnerOrReadOnly, IsAuthenticatedOrReadOnly)
+    query_budget = {'get': 4, 'post': 8, 'delete': 6}
 
     def get(self, request, user_id=None):
-        queryset = User.objects.filter(subscribers__subscriber=request.user)
-        results = self.paginate_queryset(queryset, request, view=self)
-        serializer = SubscribeSerializer(results, many=True)
+        queryset = User.objects.filter(
+            subscribers__subscriber=request.user
+        ).with_subscription_flag(request.user).order_by('id')
+        paginator = self
+        if use_cursor_pagination(request):
+            paginator = SubscriptionCursorPagination()
+        results = paginator.paginate_queryset(queryset, request, view=self)
+        recipes_limit = None
         if 'recipes_limit' in request.query_params:
-            recipes_limit = int(
-                dict(request.query_params).get('recipes_limit')[0]
-            )
-            serializer = SubscribeSerializer(
-                results, many=True, context={"recipes_limit": recipes_limit}
-            )
-        return self.get_paginated_response(serializer.data)
+            recipes_limit = int(request.query_params['recipes_limit'])
+        serializer = SubscribeSerializer(
+            prefetch_recent_recipes(results, recipes_limit), many=True
+        )
+        return paginator.get_paginated_response(serializer.data)
 
     def post(self, request, *args, **kwargs):
         user = get_object_or_404(User, id=kwargs.get('user_id'))
@@ -64,7 +72,16 @@ class APISubscription(APIView, LimitOffsetPagination):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class UserViewSet(UserViewSet):
+class UserViewSet(djoser_views.UserViewSet):
+    query_budget = {
+        'list': 3, 'retrieve': 2, 'me': 2, 'create': 5, 'set_password': 2
+    }
+
+    def get_queryset(self):
+        return super().get_queryset().with_subscription_flag(
+            self.request.user
+        )
+
     @action(["get", "put", "patch", "delete"], detail=False)
     def me(self, request, *args, **kwargs):
         self.get_object = self.get_instance
@@ -78,3 +95,11 @@ class UserViewSet(UserViewSet):
             return self.partial_update(request, *args, **kwargs)
         elif request.method == "DELETE":
             return self.destroy(request, *args, **kwargs)
+
+
+class TokenCreateView(djoser_views.TokenCreateView):
+    query_budget = {'post': 6}
+
+
+class TokenDestroyView(djoser_views.TokenDestroyView):
+    query_budget = {'post': 2}